@@ -1,8 +1,11 @@
 from __future__ import annotations
+
 from datetime import date
-from typing import List
+from time import monotonic
+from typing import AsyncIterator, List, Optional
 
 from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -45,6 +48,9 @@ from app.services.training import summarize_training_day
 
 router = Router(name="commands")
 
+# Как часто (в секундах) обновлять сообщение при потоковом ответе LLM
+STREAM_EDIT_INTERVAL = 1.0
+
 class LLMStates(StatesGroup):
     waiting = State()
 
@@ -224,8 +230,7 @@ async def cmd_ask(message: Message, state: FSMContext) -> None:
     if not user:
         await message.answer("Сначала пройдите onboarding (/start).")
         return
-    answer = await llm_client.ask(user, question[1])
-    await message.answer(answer)
+    await _answer_streaming(message, llm_client.ask_stream(user, question[1]))
 
 
 @router.message(Command("fix_timezone"))
@@ -579,8 +584,7 @@ async def handle_llm_question(message: Message, state: FSMContext) -> None:
         await message.answer("Профиль не найден. Используйте /start.")
         await state.clear()
         return
-    answer = await llm_client.ask(user, question)
-    await message.answer(answer)
+    await _answer_streaming(message, llm_client.ask_stream(user, question))
     await state.clear()
 
 
@@ -655,6 +659,37 @@ async def _prompt_llm(message: Message, state: FSMContext) -> None:
     )
 
 
+async def _answer_streaming(message: Message, chunks: AsyncIterator[str]) -> None:
+    """
+    Отправляет ответ LLM и дописывает его в том же сообщении по мере поступления фрагментов.
+
+    Промежуточные версии идут без parse_mode: недописанный тег или одиночный "<" в HTML
+    режиме роняют запрос. Разметка по умолчанию применяется только последней правкой.
+    """
+    sent: Optional[Message] = None
+    text = ""
+    last_edit = 0.0
+    async for chunk in chunks:
+        text += chunk
+        if not text.strip():
+            continue
+        now = monotonic()
+        if sent is None:
+            sent = await message.answer(text, parse_mode=None)
+            last_edit = now
+        elif now - last_edit >= STREAM_EDIT_INTERVAL:
+            await sent.edit_text(text, parse_mode=None)
+            last_edit = now
+    if sent is None:
+        return
+    try:
+        await sent.edit_text(text)
+    except TelegramBadRequest as exc:
+        # Текст без разметки совпал с уже показанным — Telegram отклоняет пустую правку
+        if "message is not modified" not in exc.message:
+            raise
+
+
 async def _get_or_generate_meal_plan(
     session, user: User, trainings: list[TrainingSession], target_calories: Optional[int] = None
 ) -> List[MealSlot]:
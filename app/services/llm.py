@@ -1,15 +1,24 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import date
 from textwrap import dedent
-from typing import Optional
+from typing import Any, AsyncIterator, Iterable, Optional
 
-from openai import OpenAI
+import fastjsonschema
+import httpx
+import orjson
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
 from app.config import settings
 from app.models import User
 
+logger = logging.getLogger(__name__)
 
 SYSTEM_PROMPT = dedent(
     """
@@ -31,10 +40,10 @@ PROFILE_SCHEMA = {
     "schema": {
         "type": "object",
         "properties": {
-            "desired_wake_time": {"type": "string", "description": "HH:MM or null"},
-            "sleep_goal_h": {"type": "number", "description": "Sleep goal in hours (float) or null"},
-            "work_start": {"type": "string", "description": "HH:MM or null"},
-            "work_end": {"type": "string", "description": "HH:MM or null"},
+            "desired_wake_time": {"type": ["string", "null"], "description": "HH:MM or null"},
+            "sleep_goal_h": {"type": ["number", "null"], "description": "Sleep goal in hours (float) or null"},
+            "work_start": {"type": ["string", "null"], "description": "HH:MM or null"},
+            "work_end": {"type": ["string", "null"], "description": "HH:MM or null"},
             "trainings": {
                 "type": "array",
                 "items": {
@@ -46,16 +55,16 @@ PROFILE_SCHEMA = {
                     "required": ["day", "time"],
                 },
             },
-            "height_cm": {"type": "integer", "description": "Height in cm or null"},
-            "weight_kg": {"type": "number", "description": "Weight in kg (float) or null"},
-            "age": {"type": "integer", "description": "Age in years or null"},
+            "height_cm": {"type": ["integer", "null"], "description": "Height in cm or null"},
+            "weight_kg": {"type": ["number", "null"], "description": "Weight in kg (float) or null"},
+            "age": {"type": ["integer", "null"], "description": "Age in years or null"},
             "sex": {"type": ["string", "null"], "description": "m for male, f for female, other, or null"},
-            "water_goal_ml": {"type": "integer", "description": "Water goal in ml or null"},
+            "water_goal_ml": {"type": ["integer", "null"], "description": "Water goal in ml or null"},
             "goals": {
                 "type": "array",
                 "items": {"type": "string"},
             },
-            "allergies": {"type": "string", "description": "Allergies or null"},
+            "allergies": {"type": ["string", "null"], "description": "Allergies or null"},
             "parse_warnings": {
                 "type": "array",
                 "items": {"type": "string"},
@@ -66,141 +75,297 @@ PROFILE_SCHEMA = {
     },
 }
 
+_SCHEMA_JSON = json.dumps(PROFILE_SCHEMA["schema"], indent=2, ensure_ascii=False)
+
+_PARSE_SYSTEM_PROMPT = dedent(
+    """
+    You are a precise JSON-extraction assistant. User will provide one short free-form Russian text 
+    describing their daily routine: wake time, desired sleep duration, working hours, training days 
+    and times, height, weight, age, sex, allergies, water goal and goals. Your job: extract values 
+    and return a single JSON object that EXACTLY matches the schema provided in the User prompt. 
+    Do NOT output any explanatory text. If a field cannot be determined, set it to null. 
+    If something looks implausible, include an entry in parse_warnings. Use 24-hour HH:MM times. 
+    Days must be Mon,Tue,Wed,Thu,Fri,Sat,Sun. Keep numbers as integers (except sleep_goal_h can be float). 
+    The JSON must be valid.
+    """
+).strip()
+
+# Схема и инструкции не меняются, поэтому промпт собирается один раз; на каждый вызов
+# подставляется только текст пользователя между префиксом и суффиксом
+_PARSE_USER_PREFIX = f"Schema:\n{_SCHEMA_JSON}\n\nUser message:\n\""
+_PARSE_USER_SUFFIX = '"' + """
+
+Instructions:
+- Extract fields from the raw text and output only the JSON object matching the Schema.
+- Normalize times to HH:MM.
+- Normalize days to Mon..Sun (Russian day names map as: пн->Mon, вт->Tue, ср->Wed, чт->Thu, пт->Fri, сб->Sat, вс->Sun).
+- If a single time is present and multiple days are listed without times, apply that time to each listed day.
+- If weight looks like it's equal to height or obviously swapped, still output both numbers but add 'possible_height_weight_swap' to parse_warnings.
+- If a numeric field is implausible (see validation rules), include 'implausible_<field>' in parse_warnings.
+- Put the original raw message into raw_text.
+- If user says '8 утра' or '8 утром', this is 08:00, not 20:00.
+- If user says '8 вечера' or '20:00', this is 20:00.
+- If user says 'с 9 до 18' or 'работаю с 9 до 18', this is work_start: '09:00' and work_end: '18:00'.
+- If user says '9-18', this is also work_start: '09:00' and work_end: '18:00'.
+- If user says '2 литра' or '2л', this is 2000 ml.
+- If user says 'мужчина' or 'м', sex is 'm'.
+- If user says 'женщина' or 'ж', sex is 'f'.
+- If water goal is not explicitly mentioned, set water_goal_ml to null.
+"""
+
+_ASK_USER_TEMPLATE = (
+    "Пользователь: {goals}\n"
+    "Сон: пробуждение {wake_time}, цель сна {sleep_hours} ч.\n"
+    "Вопрос: {question}"
+)
+
+# Валидатор компилируется один раз при импорте (fastjsonschema генерирует Python-код проверки)
+PROFILE_VALIDATOR = fastjsonschema.compile(PROFILE_SCHEMA["schema"])
+_TRAINING_VALIDATOR = fastjsonschema.compile(PROFILE_SCHEMA["schema"]["properties"]["trainings"]["items"])
+
+# Ограничения генерации: ответ на вопрос — до 5-6 предложений, сводка — до 10-15
+ASK_MAX_TOKENS = 300
+SUMMARY_MAX_TOKENS = 600
+ANSWER_TEMPERATURE = 0.3
+
+# Сколько сводок одновременно отправляется в OpenAI при пакетной генерации
+SUMMARY_BATCH_CONCURRENCY = 20
+
+# Пул соединений к OpenAI: не меньше, чем параллельных запросов при пакетной генерации
+HTTP_MAX_CONNECTIONS = 100
+HTTP_KEEPALIVE_SECONDS = 300
+
+
+def _is_valid_training(item: Any) -> bool:
+    try:
+        _TRAINING_VALIDATOR(item)
+    except fastjsonschema.JsonSchemaValueException:
+        return False
+    return True
+
+
+def validate_profile(parsed: Any) -> dict:
+    """
+    Проверяет ответ LLM по PROFILE_SCHEMA.
+    Поля с неверным типом удаляются, а в parse_warnings добавляется 'invalid_<field>'.
+    Из trainings удаляются только неверные элементы; поле пропадает, если не осталось ни одного.
+    """
+    if not isinstance(parsed, dict):
+        raise ValueError("Ответ LLM не является JSON-объектом")
+    invalid: list[str] = []
+    trainings = parsed.get("trainings")
+    if isinstance(trainings, list):
+        valid = [item for item in trainings if _is_valid_training(item)]
+        if len(valid) != len(trainings):
+            invalid.append("invalid_trainings")
+            if valid:
+                parsed["trainings"] = valid
+            else:
+                parsed.pop("trainings")
+    # Каждая итерация удаляет одно поле, поэтому число попыток ограничено количеством ключей
+    for _ in range(len(parsed) + 1):
+        try:
+            PROFILE_VALIDATOR(parsed)
+            break
+        except fastjsonschema.JsonSchemaValueException as exc:
+            field = exc.path[1] if len(exc.path) > 1 else None
+            if field not in parsed:
+                raise ValueError(f"Ответ LLM не соответствует схеме: {exc.message}") from exc
+            parsed.pop(field)
+            invalid.append(f"invalid_{field}")
+    if invalid:
+        parsed.setdefault("parse_warnings", []).extend(invalid)
+    return parsed
+
+
+def _band(value: float) -> str:
+    """Относит число к типичному диапазону веса (40–150) или роста (150–220)."""
+    if 40 <= value <= 150:
+        return "weight"
+    if 150 < value <= 220:
+        return "height"
+    return "other"
+
+
+# Пары (диапазон height_cm, диапазон weight_kg), в которых значения могли перепутать:
+# рост похож на вес, а вес на рост, или оба похожи на рост
+_SWAP_BANDS = frozenset({("weight", "height"), ("height", "height")})
+# Меняем местами, только если "вес" заметно больше "роста": 150 см / 152 кг вполне правдоподобны
+_SWAP_MIN_MARGIN = 20
+
+
+def fix_height_weight_swap(parsed: dict) -> dict:
+    """Меняет местами рост и вес, если LLM (или пользователь) их перепутали."""
+    height = parsed.get("height_cm")
+    weight = parsed.get("weight_kg")
+    if not height or not weight:
+        return parsed
+    if (_band(height), _band(weight)) in _SWAP_BANDS and weight - height > _SWAP_MIN_MARGIN:
+        parsed["height_cm"], parsed["weight_kg"] = round(weight), float(height)
+    return parsed
+
+
+class ResponseCache:
+    """LRU-кэш ответов LLM с ограниченным временем жизни записей."""
+
+    def __init__(self, maxsize: int = 512, ttl_seconds: float = 24 * 3600) -> None:
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    @staticmethod
+    def make_key(*parts: object) -> str:
+        raw = "\x1f".join(str(part) for part in parts)
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
 
 class LLMClient:
     def __init__(self, api_key: Optional[str]) -> None:
         self.enabled = bool(api_key)
-        self._client: Optional[OpenAI] = None
+        self._client: Optional[AsyncOpenAI] = None
         if api_key:
-            self._client = OpenAI(api_key=api_key)
+            # Один асинхронный клиент на процесс: его httpx-пул соединений переиспользуется между вызовами,
+            # keep-alive держим дольше дефолтных 5 секунд, чтобы не платить за TLS-рукопожатие на каждый вопрос
+            self._client = AsyncOpenAI(
+                api_key=api_key,
+                http_client=DefaultAsyncHttpxClient(
+                    # Без своего transport: иначе httpx перестаёт брать прокси из HTTPS_PROXY/ALL_PROXY,
+                    # а повторы при ошибках соединения уже делает сам SDK (max_retries)
+                    limits=httpx.Limits(
+                        max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                        keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+                    ),
+                ),
+            )
+        # Точные совпадения: одинаковый вопрос при одинаковом профиле (цели, подъём, цель сна)
+        self._ask_cache = ResponseCache()
+        # Сводка за день не меняется, пока не изменились данные пользователя
+        self._summary_cache = ResponseCache()
+        # Повторная отправка того же текста анкеты (ретраи, правки) не должна снова идти в LLM
+        self._parse_cache = ResponseCache(maxsize=1024)
+
+    @staticmethod
+    def _ask_prompt(user: User, question: str) -> str:
+        return _ASK_USER_TEMPLATE.format(
+            goals=user.goals or "без цели",
+            wake_time=user.desired_wake_time.strftime("%H:%M"),
+            sleep_hours=user.sleep_goal_minutes // 60,
+            question=question,
+        )
 
     async def ask(self, user: User, question: str) -> str:
         if not self.enabled or not self._client:
             return "LLM недоступна. Проверьте API-ключ. " + DISCLAIMER
 
+        user_prompt = self._ask_prompt(user, question)
+        cache_key = ResponseCache.make_key(user_prompt)
+        cached = self._ask_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         content = [
             {"role": "system", "content": SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": dedent(
-                    f"""
-                    Пользователь: {user.goals or 'без цели'}
-                    Сон: пробуждение {user.desired_wake_time.strftime('%H:%M')}, цель сна {user.sleep_goal_minutes // 60} ч.
-                    Вопрос: {question}
-                    """
-                ).strip(),
-            },
+            {"role": "user", "content": user_prompt},
         ]
-        response = await asyncio.to_thread(
-            self._client.chat.completions.create,
+        response = await self._client.chat.completions.create(
             model="gpt-4o-mini",
             messages=content,
+            max_tokens=ASK_MAX_TOKENS,
+            temperature=ANSWER_TEMPERATURE,
         )
         answer = response.choices[0].message.content.strip()
-        return f"{answer}\n\n{DISCLAIMER}"
+        result = f"{answer}\n\n{DISCLAIMER}"
+        self._ask_cache.set(cache_key, result)
+        return result
 
-    async def parse_profile(self, raw_text: str) -> dict:
+    async def ask_stream(self, user: User, question: str) -> AsyncIterator[str]:
+        """
+        Потоковый вариант ask(): отдаёт фрагменты ответа по мере генерации.
+        Дисклеймер приходит последним фрагментом, готовый ответ сохраняется в тот же кэш, что и у ask().
+        """
         if not self.enabled or not self._client:
-            raise RuntimeError("LLM недоступна")
-        
-        system_prompt = dedent(
-            """
-            You are a precise JSON-extraction assistant. User will provide one short free-form Russian text 
-            describing their daily routine: wake time, desired sleep duration, working hours, training days 
-            and times, height, weight, age, sex, allergies, water goal and goals. Your job: extract values 
-            and return a single JSON object that EXACTLY matches the schema provided in the User prompt. 
-            Do NOT output any explanatory text. If a field cannot be determined, set it to null. 
-            If something looks implausible, include an entry in parse_warnings. Use 24-hour HH:MM times. 
-            Days must be Mon,Tue,Wed,Thu,Fri,Sat,Sun. Keep numbers as integers (except sleep_goal_h can be float). 
-            The JSON must be valid.
-            """
-        ).strip()
-        
-        user_prompt = f"""Schema:
-{json.dumps(PROFILE_SCHEMA["schema"], indent=2, ensure_ascii=False)}
+            yield "LLM недоступна. Проверьте API-ключ. " + DISCLAIMER
+            return
 
-User message:
-"{raw_text}"
+        user_prompt = self._ask_prompt(user, question)
+        cache_key = ResponseCache.make_key(user_prompt)
+        cached = self._ask_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
 
-Instructions:
-- Extract fields from the raw text and output only the JSON object matching the Schema.
-- Normalize times to HH:MM.
-- Normalize days to Mon..Sun (Russian day names map as: пн->Mon, вт->Tue, ср->Wed, чт->Thu, пт->Fri, сб->Sat, вс->Sun).
-- If a single time is present and multiple days are listed without times, apply that time to each listed day.
-- If weight looks like it's equal to height or obviously swapped, still output both numbers but add 'possible_height_weight_swap' to parse_warnings.
-- If a numeric field is implausible (see validation rules), include 'implausible_<field>' in parse_warnings.
-- Put the original raw message into raw_text.
-- If user says '8 утра' or '8 утром', this is 08:00, not 20:00.
-- If user says '8 вечера' or '20:00', this is 20:00.
-- If user says 'с 9 до 18' or 'работаю с 9 до 18', this is work_start: '09:00' and work_end: '18:00'.
-- If user says '9-18', this is also work_start: '09:00' and work_end: '18:00'.
-- If user says '2 литра' or '2л', this is 2000 ml.
-- If user says 'мужчина' or 'м', sex is 'm'.
-- If user says 'женщина' or 'ж', sex is 'f'.
-- If water goal is not explicitly mentioned, set water_goal_ml to null.
-"""
-        
-        response = await asyncio.to_thread(
-            self._client.chat.completions.create,
+        stream = await self._client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt},
             ],
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "user_profile",
-                    **PROFILE_SCHEMA["schema"]
-                }
-            },
+            max_tokens=ASK_MAX_TOKENS,
+            temperature=ANSWER_TEMPERATURE,
+            stream=True,
         )
-        content = response.choices[0].message.content
-        if not content:
-            raise ValueError("Пустой ответ от LLM")
-        parsed = json.loads(content)
-        
-        # Проверяем предупреждения о возможной перестановке роста и веса
-        warnings = parsed.get("parse_warnings", [])
-        if "possible_height_weight_swap" in warnings:
-            # Меняем местами рост и вес
-            if parsed.get("height_cm") and parsed.get("weight_kg"):
-                height = parsed["height_cm"]
-                weight = parsed["weight_kg"]
-                # Если рост больше веса и это выглядит неправильно, меняем местами
-                if height > weight and height > 100:  # Рост не должен быть больше веса в кг
-                    parsed["height_cm"], parsed["weight_kg"] = weight, height
+        parts: list[str] = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        tail = f"\n\n{DISCLAIMER}"
+        yield tail
+        self._ask_cache.set(cache_key, "".join(parts).strip() + tail)
+
+    async def parse_profile(self, raw_text: str) -> dict:
+        if not self.enabled or not self._client:
+            raise RuntimeError("LLM недоступна")
         
-        # Дополнительная проверка: если вес равен росту или очень близок, это подозрительно
-        if parsed.get("height_cm") and parsed.get("weight_kg"):
-            height = parsed["height_cm"]
-            weight = parsed["weight_kg"]
-            # Если вес равен росту (например, оба 172), это явная ошибка
-            # Обычно рост 150-220 см, вес 40-150 кг
-            if height == weight or abs(height - weight) < 10:
-                # Если оба значения в диапазоне роста (150-220), то большее - рост, меньшее - вес
-                if 150 <= height <= 220 and 150 <= weight <= 220:
-                    # Оба в диапазоне роста - это ошибка, нужно поменять местами
-                    if height > weight:
-                        # height больше, значит это действительно рост, weight должен быть меньше
-                        # Но если weight тоже в диапазоне роста, это ошибка
-                        # В этом случае оставляем как есть, но логируем предупреждение
-                        pass
-                    else:
-                        # weight больше height, но оба в диапазоне роста - явная ошибка
-                        parsed["height_cm"], parsed["weight_kg"] = weight, height
-                # Если height в диапазоне веса (40-150) и weight в диапазоне роста (150-220), перепутаны
-                elif 40 <= height <= 150 and 150 <= weight <= 200:
-                    parsed["height_cm"], parsed["weight_kg"] = weight, height
-                # Если weight в диапазоне роста (150-220) и height тоже, но weight больше - возможно перепутаны
-                elif 150 <= weight <= 220 and 150 <= height <= 220 and weight > height:
-                    # weight больше height, но оба в диапазоне роста - возможно перепутаны
-                    # Но если разница большая, то weight может быть правильным ростом
-                    if weight - height > 20:
-                        # Большая разница - скорее всего weight это рост
-                        parsed["height_cm"], parsed["weight_kg"] = weight, height
+        # Кэшируется сырой JSON: разбор на каждый вызов даёт вызывающему собственный словарь
+        cache_key = ResponseCache.make_key(raw_text)
+        content = self._parse_cache.get(cache_key)
+        if content is None:
+            user_prompt = f"{_PARSE_USER_PREFIX}{raw_text}{_PARSE_USER_SUFFIX}"
+            response = await self._client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": _PARSE_SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt},
+                ],
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": "user_profile",
+                        **PROFILE_SCHEMA["schema"]
+                    }
+                },
+            )
+            content = response.choices[0].message.content
+            if not content:
+                raise ValueError("Пустой ответ от LLM")
+        parsed = validate_profile(orjson.loads(content))
+        # В кэш попадает только разобравшийся ответ
+        self._parse_cache.set(cache_key, content)
         
-        return parsed
+        # Типы полей уже проверены схемой, дальше только эвристика перестановки роста и веса
+        return fix_height_weight_swap(parsed)
 
     async def generate_summary(
         self,
@@ -238,18 +403,49 @@ Instructions:
             Ответ должен быть на русском языке, объёмом 10-15 предложений.
             """
         ).strip()
+        cache_key = ResponseCache.make_key(user.telegram_id, date.today().isoformat(), summary_prompt)
+        cached = self._summary_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
         content = [
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": summary_prompt},
         ]
-        response = await asyncio.to_thread(
-            self._client.chat.completions.create,
+        response = await self._client.chat.completions.create(
             model="gpt-4o-mini",
             messages=content,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=ANSWER_TEMPERATURE,
         )
         answer = response.choices[0].message.content.strip()
-        return f"{answer}\n\n{DISCLAIMER}"
+        result = f"{answer}\n\n{DISCLAIMER}"
+        self._summary_cache.set(cache_key, result)
+        return result
+
+    async def generate_summaries_batch(
+        self,
+        items: Iterable[tuple[User, dict]],
+        concurrency: int = SUMMARY_BATCH_CONCURRENCY,
+    ) -> list[Optional[str]]:
+        """
+        Генерирует сводки для нескольких пользователей параллельно.
+
+        Число одновременных запросов ограничено семафором, чтобы не упираться в лимиты OpenAI.
+        Результаты возвращаются в порядке входных пар (пользователь, данные); если для кого-то
+        сводку получить не удалось (лимиты, таймаут), на его месте None, остальные не теряются.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _one(user: User, summary_data: dict) -> Optional[str]:
+            async with semaphore:
+                try:
+                    return await self.generate_summary(user, summary_data)
+                except Exception as exc:
+                    logger.warning("Failed to generate summary for user %s: %s", user.telegram_id, exc)
+                    return None
+
+        return list(await asyncio.gather(*(_one(user, data) for user, data in items)))
 
 
 llm_client = LLMClient(api_key=settings.openai_api_key.get_secret_value() if settings.openai_api_key else None)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import json
-import json
+import re
 from typing import Iterable, List
 
 
@@ -15,6 +15,9 @@ AVAILABLE_MODULES = [
 
 DEFAULT_MODULES = ["sleep", "hydration", "training"]
 
+_ALLOWED_MODULES = frozenset(item["id"] for item in AVAILABLE_MODULES)
+_DEFAULT_MODULES_TUPLE = tuple(DEFAULT_MODULES)
+
 MODULE_KEYWORDS = {
     "сон": "sleep",
     "энерг": "energy",
@@ -30,18 +33,22 @@ MODULE_KEYWORDS = {
     "симп": "symptoms",
 }
 
+# Все ключевые слова одним проходом; lookahead находит и перекрывающиеся вхождения
+_KEYWORDS_RE = re.compile(
+    "(?=(" + "|".join(map(re.escape, sorted(MODULE_KEYWORDS, key=len, reverse=True))) + "))"
+)
+
 
 def normalize_modules(modules: Iterable[str]) -> list[str]:
-    allowed = {item["id"] for item in AVAILABLE_MODULES}
-    normal = [module for module in modules if module in allowed]
+    normal = [module for module in modules if module in _ALLOWED_MODULES]
     if not normal:
-        return DEFAULT_MODULES.copy()
+        return list(_DEFAULT_MODULES_TUPLE)
     return sorted(set(normal))
 
 
 def modules_from_text(text: str) -> list[str]:
     lowered = text.lower()
-    detected = {module for key, module in MODULE_KEYWORDS.items() if key in lowered}
+    detected = {MODULE_KEYWORDS[key] for key in _KEYWORDS_RE.findall(lowered)}
     return normalize_modules(detected)
 
 
@@ -51,12 +58,12 @@ def dumps_modules(modules: Iterable[str]) -> str:
 
 def loads_modules(payload: str | None) -> List[str]:
     if not payload:
-        return DEFAULT_MODULES.copy()
+        return list(_DEFAULT_MODULES_TUPLE)
     try:
         parsed = json.loads(payload)
         if isinstance(parsed, list):
             return normalize_modules(parsed)
     except json.JSONDecodeError:
         pass
-    return DEFAULT_MODULES.copy()
+    return list(_DEFAULT_MODULES_TUPLE)
 
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-import json
+from bisect import insort
 from dataclasses import dataclass
-from datetime import date, datetime, time, timedelta
+from datetime import date, time, timedelta
 from typing import Iterable, Optional
 
+import orjson
+
 from app.models import MealType, TrainingSession, User
 from app.services.sleep import minutes_to_time
 
@@ -17,6 +19,25 @@ MEAL_LABELS = {
 }
 
 
+# Доли калоража по приёмам пищи в день с тренировкой и без неё
+MEAL_DISTRIBUTION_WITH_TRAINING = {
+    MealType.BREAKFAST: 0.25,
+    MealType.LUNCH: 0.30,
+    MealType.DINNER: 0.20,
+    MealType.SNACK: 0.10,
+    MealType.POST_WORKOUT: 0.15,
+}
+MEAL_DISTRIBUTION_WITHOUT_TRAINING = {
+    MealType.BREAKFAST: 0.30,
+    MealType.LUNCH: 0.35,
+    MealType.DINNER: 0.30,
+    MealType.SNACK: 0.05,
+}
+
+# Приёмы пищи, привязанные к тренировке, убираются из плана при её отмене
+_CANCEL_DROP = frozenset({MealType.SNACK, MealType.POST_WORKOUT})
+
+
 @dataclass(slots=True)
 class MealSlot:
     meal_type: MealType
@@ -26,8 +47,76 @@ class MealSlot:
     recommendation: str
 
 
-def _add_minutes(base: time, minutes: int) -> time:
-    return minutes_to_time(base.hour * 60 + base.minute + minutes)
+@dataclass(frozen=True, slots=True)
+class _SlotSpec:
+    """Шаблон приёма пищи: от какой точки дня отсчитывается время, окно, доли Б/Ж/У и текст совета."""
+
+    meal_type: MealType
+    anchor: str  # "wake" — подъём, "work" — середина рабочего дня, "training" — начало тренировки
+    offset: int
+    window_before: int
+    window_after: int
+    macros: tuple[float, float, float]
+    text: str
+
+
+_BREAKFAST = _SlotSpec(
+    MealType.BREAKFAST, "wake", 45, 30, 30, (0.30, 0.25, 0.45),
+    "Плотный завтрак в течение часа после пробуждения. Пример: омлет с овощами, "
+    "цельнозерновой тост и ягоды. ~{kcal} ккал, Б/Ж/У {protein}/{fat}/{carbs} г.",
+)
+_LUNCH_AT_WORK = _SlotSpec(
+    MealType.LUNCH, "work", 0, 45, 45, (0.30, 0.25, 0.45),
+    "Сбалансированный обед в рабочем окне. Пример: запечённая курица, киноа и салат "
+    "с оливковым маслом. ~{kcal} ккал, Б/Ж/У {protein}/{fat}/{carbs} г.",
+)
+_LUNCH_FREE = _SlotSpec(
+    MealType.LUNCH, "wake", 300, 60, 60, (0.30, 0.25, 0.45),
+    "Сбалансированный обед. Пример: рыба на пару, бурый рис и тушёные овощи. "
+    "~{kcal} ккал, Б/Ж/У {protein}/{fat}/{carbs} г.",
+)
+_TRAINING_DAY_SLOTS = (
+    _SlotSpec(
+        MealType.DINNER, "training", -150, 30, 30, (0.35, 0.25, 0.40),
+        "Ужин за 2–3 часа до тренировки. Пример: гречка с индейкой и овощами. "
+        "~{kcal} ккал, Б/Ж/У {protein}/{fat}/{carbs} г.",
+    ),
+    _SlotSpec(
+        MealType.SNACK, "training", -45, 15, 15, (0.20, 0.20, 0.60),
+        "Перекус за 30–60 минут до тренировки. Пример: банан + греческий йогурт или смузи. "
+        "~{kcal} ккал, Б/Ж/У {protein}/{fat}/{carbs} г.",
+    ),
+    _SlotSpec(
+        MealType.POST_WORKOUT, "training", 30, 0, 60, (0.40, 0.20, 0.40),
+        "Восстановительный приём пищи в течение часа после тренировки. "
+        "Пример: творог с ягодами и мёдом или протеиновый коктейль + банан. "
+        "~{kcal} ккал, Б/Ж/У {protein}/{fat}/{carbs} г.",
+    ),
+)
+_REST_DAY_SLOTS = (
+    _SlotSpec(
+        MealType.DINNER, "wake", 12 * 60, 45, 45, (0.30, 0.25, 0.45),
+        "Ужин за 2–3 часа до сна. Пример: запечённый лосось с овощами и стакан кефира. "
+        "~{kcal} ккал, Б/Ж/У {protein}/{fat}/{carbs} г.",
+    ),
+    # Перекус между обедом и ужином, примерно через 8 часов после пробуждения
+    _SlotSpec(
+        MealType.SNACK, "wake", 8 * 60, 30, 30, (0.25, 0.30, 0.45),
+        "Перекус между обедом и ужином. Пример: орехи, фрукт или йогурт. "
+        "~{kcal} ккал, Б/Ж/У {protein}/{fat}/{carbs} г.",
+    ),
+)
+
+
+def _day_minute(slot: tuple[MealType, int, int, int, str]) -> int:
+    """Ключ упорядочивания слота: минута суток его целевого времени (с переходом через полночь)."""
+    return slot[1] % (24 * 60)
+
+
+def _macros(kcal: int, ratios: tuple[float, float, float]) -> tuple[int, int, int]:
+    """Граммы Б/Ж/У по долям калорий (белок и углеводы — 4 ккал/г, жиры — 9 ккал/г)."""
+    protein, fat, carbs = ratios
+    return int(kcal * protein / 4), int(kcal * fat / 9), int(kcal * carbs / 4)
 
 
 def generate_daily_plan(
@@ -42,7 +131,6 @@ def generate_daily_plan(
     Генерирует план питания на день с распределением калорий.
     Если target_calories указан, калории распределяются пропорционально между приёмами пищи.
     """
-    plan: list[MealSlot] = []
     today = date.today()
     training: Optional[TrainingSession] = next(
         (t for t in trainings if t.planned_time.date() == today), None
@@ -50,190 +138,73 @@ def generate_daily_plan(
     
     # Определяем базовые пропорции калорий для разных сценариев
     if training:
-        # С тренировкой: завтрак 25%, обед 30%, ужин 20%, перекус 10%, после тренировки 15%
-        base_distribution = {
-            MealType.BREAKFAST: 0.25,
-            MealType.LUNCH: 0.30,
-            MealType.DINNER: 0.20,
-            MealType.SNACK: 0.10,
-            MealType.POST_WORKOUT: 0.15,
-        }
+        base_distribution = MEAL_DISTRIBUTION_WITH_TRAINING
     else:
-        # Без тренировки: завтрак 30%, обед 35%, ужин 30%, перекус 5%
-        base_distribution = {
-            MealType.BREAKFAST: 0.30,
-            MealType.LUNCH: 0.35,
-            MealType.DINNER: 0.30,
-            MealType.SNACK: 0.05,
-        }
+        base_distribution = MEAL_DISTRIBUTION_WITHOUT_TRAINING
     
     # Если target_calories не указан, используем дефолтные значения
     if target_calories is None:
         target_calories = 2000  # Дефолтное значение
     
-    # Рассчитываем калории для каждого приёма пищи
-    breakfast_kcal = int(target_calories * base_distribution[MealType.BREAKFAST])
-    lunch_kcal = int(target_calories * base_distribution[MealType.LUNCH])
-    dinner_kcal = int(target_calories * base_distribution[MealType.DINNER])
-    
-    # Рассчитываем БЖУ для завтрака (30/25/45%)
-    breakfast_protein = int(breakfast_kcal * 0.30 / 4)
-    breakfast_fat = int(breakfast_kcal * 0.25 / 9)
-    breakfast_carbs = int(breakfast_kcal * 0.45 / 4)
-    
-    breakfast_time = _add_minutes(wake_time, 45)
-    plan.append(
-        MealSlot(
-            meal_type=MealType.BREAKFAST,
-            target_time=breakfast_time,
-            window_start=_add_minutes(wake_time, 15),
-            window_end=_add_minutes(wake_time, 75),
-            recommendation=(
-                f"Плотный завтрак в течение часа после пробуждения. Пример: омлет с овощами, "
-                f"цельнозерновой тост и ягоды. ~{breakfast_kcal} ккал, Б/Ж/У {breakfast_protein}/{breakfast_fat}/{breakfast_carbs} г."
-            ),
-        )
-    )
-
+    # Точки отсчёта в минутах от полуночи; в time переводим только при сборке MealSlot
+    anchors = {"wake": wake_time.hour * 60 + wake_time.minute}
     if work_start and work_end:
-        midpoint = minutes_to_time(
+        anchors["work"] = (
             (work_start.hour * 60 + work_start.minute + work_end.hour * 60 + work_end.minute) // 2
-        )
-        lunch_protein = int(lunch_kcal * 0.30 / 4)
-        lunch_fat = int(lunch_kcal * 0.25 / 9)
-        lunch_carbs = int(lunch_kcal * 0.45 / 4)
-        plan.append(
-            MealSlot(
-                meal_type=MealType.LUNCH,
-                target_time=midpoint,
-                window_start=_add_minutes(midpoint, -45),
-                window_end=_add_minutes(midpoint, 45),
-                recommendation=(
-                    f"Сбалансированный обед в рабочем окне. Пример: запечённая курица, киноа и салат "
-                    f"с оливковым маслом. ~{lunch_kcal} ккал, Б/Ж/У {lunch_protein}/{lunch_fat}/{lunch_carbs} г."
-                ),
-            )
-        )
+        ) % (24 * 60)
+        lunch = _LUNCH_AT_WORK
     else:
-        lunch_protein = int(lunch_kcal * 0.30 / 4)
-        lunch_fat = int(lunch_kcal * 0.25 / 9)
-        lunch_carbs = int(lunch_kcal * 0.45 / 4)
-        plan.append(
-            MealSlot(
-                meal_type=MealType.LUNCH,
-                target_time=_add_minutes(wake_time, 300),
-                window_start=_add_minutes(wake_time, 240),
-                window_end=_add_minutes(wake_time, 360),
-                recommendation=(
-                    f"Сбалансированный обед. Пример: рыба на пару, бурый рис и тушёные овощи. "
-                    f"~{lunch_kcal} ккал, Б/Ж/У {lunch_protein}/{lunch_fat}/{lunch_carbs} г."
-                ),
-            )
-        )
-
+        lunch = _LUNCH_FREE
     if training:
-        training_time = training.planned_time.time()
-        dinner_time = minutes_to_time(training_time.hour * 60 + training_time.minute - 150)
-        dinner_protein = int(dinner_kcal * 0.35 / 4)
-        dinner_fat = int(dinner_kcal * 0.25 / 9)
-        dinner_carbs = int(dinner_kcal * 0.40 / 4)
-        plan.append(
-            MealSlot(
-                meal_type=MealType.DINNER,
-                target_time=dinner_time,
-                window_start=_add_minutes(dinner_time, -30),
-                window_end=_add_minutes(dinner_time, 30),
-                recommendation=(
-                    f"Ужин за 2–3 часа до тренировки. Пример: гречка с индейкой и овощами. "
-                    f"~{dinner_kcal} ккал, Б/Ж/У {dinner_protein}/{dinner_fat}/{dinner_carbs} г."
-                ),
-            )
-        )
-        pre_workout = minutes_to_time(training_time.hour * 60 + training_time.minute - 45)
-        snack_kcal = int(target_calories * base_distribution[MealType.SNACK])
-        snack_protein = int(snack_kcal * 0.20 / 4)
-        snack_fat = int(snack_kcal * 0.20 / 9)
-        snack_carbs = int(snack_kcal * 0.60 / 4)
-        plan.append(
-            MealSlot(
-                meal_type=MealType.SNACK,
-                target_time=pre_workout,
-                window_start=_add_minutes(pre_workout, -15),
-                window_end=_add_minutes(pre_workout, 15),
-                recommendation=(
-                    f"Перекус за 30–60 минут до тренировки. Пример: банан + греческий йогурт или смузи. "
-                    f"~{snack_kcal} ккал, Б/Ж/У {snack_protein}/{snack_fat}/{snack_carbs} г."
-                ),
-            )
-        )
-        post = minutes_to_time(training_time.hour * 60 + training_time.minute + 30)
-        post_kcal = int(target_calories * base_distribution[MealType.POST_WORKOUT])
-        post_protein = int(post_kcal * 0.40 / 4)
-        post_fat = int(post_kcal * 0.20 / 9)
-        post_carbs = int(post_kcal * 0.40 / 4)
-        plan.append(
-            MealSlot(
-                meal_type=MealType.POST_WORKOUT,
-                target_time=post,
-                window_start=post,
-                window_end=_add_minutes(post, 60),
-                recommendation=(
-                    f"Восстановительный приём пищи в течение часа после тренировки. "
-                    f"Пример: творог с ягодами и мёдом или протеиновый коктейль + банан. "
-                    f"~{post_kcal} ккал, Б/Ж/У {post_protein}/{post_fat}/{post_carbs} г."
-                ),
-            )
-        )
+        planned = training.planned_time
+        anchors["training"] = planned.hour * 60 + planned.minute
+        rest_of_day: tuple[_SlotSpec, ...] = _TRAINING_DAY_SLOTS
     else:
-        dinner = _add_minutes(wake_time, 12 * 60)
-        dinner_protein = int(dinner_kcal * 0.30 / 4)
-        dinner_fat = int(dinner_kcal * 0.25 / 9)
-        dinner_carbs = int(dinner_kcal * 0.45 / 4)
-        plan.append(
-            MealSlot(
-                meal_type=MealType.DINNER,
-                target_time=dinner,
-                window_start=_add_minutes(dinner, -45),
-                window_end=_add_minutes(dinner, 45),
-                recommendation=(
-                    f"Ужин за 2–3 часа до сна. Пример: запечённый лосось с овощами и стакан кефира. "
-                    f"~{dinner_kcal} ккал, Б/Ж/У {dinner_protein}/{dinner_fat}/{dinner_carbs} г."
-                ),
-            )
-        )
-        # Добавляем перекус между обедом и ужином, если нет тренировки
-        snack_time = _add_minutes(wake_time, 8 * 60)  # Примерно через 8 часов после пробуждения
-        snack_kcal = int(target_calories * base_distribution[MealType.SNACK])
-        snack_protein = int(snack_kcal * 0.25 / 4)
-        snack_fat = int(snack_kcal * 0.30 / 9)
-        snack_carbs = int(snack_kcal * 0.45 / 4)
-        plan.append(
-            MealSlot(
-                meal_type=MealType.SNACK,
-                target_time=snack_time,
-                window_start=_add_minutes(snack_time, -30),
-                window_end=_add_minutes(snack_time, 30),
-                recommendation=(
-                    f"Перекус между обедом и ужином. Пример: орехи, фрукт или йогурт. "
-                    f"~{snack_kcal} ккал, Б/Ж/У {snack_protein}/{snack_fat}/{snack_carbs} г."
-                ),
-            )
+        rest_of_day = _REST_DAY_SLOTS
+
+    # Слоты вставляются сразу по порядку времени суток, поэтому итоговая сортировка не нужна
+    slots: list[tuple[MealType, int, int, int, str]] = []
+    for spec in (_BREAKFAST, lunch, *rest_of_day):
+        target_m = anchors[spec.anchor] + spec.offset
+        kcal = int(target_calories * base_distribution[spec.meal_type])
+        protein, fat, carbs = _macros(kcal, spec.macros)
+        insort(
+            slots,
+            (
+                spec.meal_type,
+                target_m,
+                target_m - spec.window_before,
+                target_m + spec.window_after,
+                spec.text.format(kcal=kcal, protein=protein, fat=fat, carbs=carbs),
+            ),
+            key=_day_minute,
         )
 
-    plan.sort(key=lambda slot: slot.target_time)
-    return plan
+    return [
+        MealSlot(
+            meal_type=meal_type,
+            target_time=minutes_to_time(target_m),
+            window_start=minutes_to_time(start_m),
+            window_end=minutes_to_time(end_m),
+            recommendation=recommendation,
+        )
+        for meal_type, target_m, start_m, end_m, recommendation in slots
+    ]
 
 
 def adapt_plan_after_training_cancel(plan: list[MealSlot]) -> list[MealSlot]:
-    filtered = [slot for slot in plan if slot.meal_type not in (MealType.SNACK, MealType.POST_WORKOUT)]
-    for slot in filtered:
+    filtered: list[MealSlot] = []
+    for slot in plan:
+        if slot.meal_type in _CANCEL_DROP:
+            continue
         if slot.meal_type == MealType.DINNER:
             slot.recommendation = "Сместите ужин ближе к концу рабочего дня, фокус на белок+овощи."
+        filtered.append(slot)
     return filtered
 
 
 def serialize_plan(plan: list[MealSlot]) -> str:
-    return json.dumps(
+    return orjson.dumps(
         [
             {
                 "meal_type": slot.meal_type.value,
@@ -243,23 +214,28 @@ def serialize_plan(plan: list[MealSlot]) -> str:
                 "recommendation": slot.recommendation,
             }
             for slot in plan
-        ],
-        ensure_ascii=False,
-    )
+        ]
+    ).decode()
+
+
+def _parse_hm(value: str) -> time:
+    """Разбирает "ЧЧ:ММ" без strptime; для неверного значения бросает ValueError, как и strptime."""
+    hours, sep, minutes = value.partition(":")
+    if not sep:
+        raise ValueError(f"Неверное время: {value!r}")
+    return time(int(hours), int(minutes))
 
 
 def deserialize_plan(payload: str) -> list[MealSlot]:
-    data = json.loads(payload)
-    plan: list[MealSlot] = []
-    for item in data:
-        plan.append(
-            MealSlot(
-                meal_type=MealType(item["meal_type"]),
-                target_time=datetime.strptime(item["target_time"], "%H:%M").time(),
-                window_start=datetime.strptime(item["window_start"], "%H:%M").time(),
-                window_end=datetime.strptime(item["window_end"], "%H:%M").time(),
-                recommendation=item["recommendation"],
-            )
+    data = orjson.loads(payload)
+    return [
+        MealSlot(
+            meal_type=MealType(item["meal_type"]),
+            target_time=_parse_hm(item["target_time"]),
+            window_start=_parse_hm(item["window_start"]),
+            window_end=_parse_hm(item["window_end"]),
+            recommendation=item["recommendation"],
         )
-    return plan
+        for item in data
+    ]
 
@@ -1,10 +1,43 @@
 from __future__ import annotations
 
-import json
-from datetime import datetime, time, timedelta
-from typing import Any, Optional
+from datetime import datetime, time
+from functools import lru_cache
+from typing import Any, Iterable, NamedTuple, Optional
 
-from app.services.llm import llm_client
+import orjson
+from openai import OpenAIError
+
+from app.services.llm import ResponseCache, llm_client
+
+
+# Коэффициенты активности для TDEE
+_ACTIVITY_FACTORS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'high': 1.725,
+    'very_high': 1.9,
+}
+
+# Корректировка нормы воды по уровню активности
+_WATER_MULTIPLIERS = {
+    'sedentary': 0.95,
+    'light': 1.0,
+    'moderate': 1.0,
+    'high': 1.02,
+    'very_high': 1.05,
+}
+
+# Приёмы пищи: название, доля калорий и макронутриентов, пример блюда.
+# Доля None — приём получает остаток, чтобы суммы совпадали с дневными (перекус ~10%)
+_MEAL_SPLIT = (
+    ("Breakfast", 0.25, "Омлет с овощами, цельнозерновой тост"),
+    ("Lunch", 0.35, "Запечённая курица, киноа, салат с оливковым маслом"),
+    ("Dinner", 0.30, "Запечённый лосось с овощами"),
+    ("Snack", None, "Греческий йогурт с ягодами"),
+)
+
+_DAY_MINUTES = 24 * 60
 
 
 def calculate_bmi(weight_kg: float, height_cm: float) -> float:
@@ -30,25 +63,18 @@ def calculate_bmr(weight_kg: float, height_cm: float, age: int, sex: str) -> int
         bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age + 5
     else:  # 'f'
         bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age - 161
-    return int(round(bmr))
+    return round(bmr)
 
 
 def get_activity_factor(activity: str) -> float:
     """Возвращает коэффициент активности"""
-    factors = {
-        'sedentary': 1.2,
-        'light': 1.375,
-        'moderate': 1.55,
-        'high': 1.725,
-        'very_high': 1.9,
-    }
-    return factors.get(activity, 1.55)  # По умолчанию moderate
+    return _ACTIVITY_FACTORS.get(activity, 1.55)  # По умолчанию moderate
 
 
 def calculate_tdee(bmr: int, activity: str) -> int:
     """Рассчитывает TDEE (Total Daily Energy Expenditure)"""
     factor = get_activity_factor(activity)
-    return int(round(bmr * factor))
+    return round(bmr * factor)
 
 
 def calculate_target_calories(tdee: int, goal: str, age: int) -> int:
@@ -77,7 +103,17 @@ def calculate_target_calories(tdee: int, goal: str, age: int) -> int:
         return tdee
 
 
-def calculate_macros(total_kcal: int, weight_kg: float, goal: str) -> dict[str, Any]:
+class Macros(NamedTuple):
+    """Макронутриенты на день: граммы и соответствующие им ккал"""
+    protein_g: int
+    fat_g: int
+    carb_g: int
+    protein_kcal: int
+    fat_kcal: int
+    carb_kcal: int
+
+
+def calculate_macros(total_kcal: int, weight_kg: float, goal: str) -> Macros:
     """
     Рассчитывает макронутриенты в граммах и ккал.
     
@@ -87,7 +123,7 @@ def calculate_macros(total_kcal: int, weight_kg: float, goal: str) -> dict[str,
         goal: Цель ('maintain', 'lose', 'gain')
     
     Returns:
-        Словарь с макронутриентами
+        Макронутриенты; в словарь (как в плане) переводятся через ._asdict()
     """
     # Белок: 1.6 г/кг для maintain/lose, 1.8 г/кг для gain
     protein_per_kg = 1.8 if goal == 'gain' else 1.6
@@ -96,21 +132,15 @@ def calculate_macros(total_kcal: int, weight_kg: float, goal: str) -> dict[str,
     
     # Жиры: 25% от общего количества калорий
     fat_pct = 0.25
-    fat_kcal = int(round(total_kcal * fat_pct))
+    fat_kcal = round(total_kcal * fat_pct)
     fat_g = round(fat_kcal / 9)
     
     # Углеводы: остаток
     carb_kcal = total_kcal - protein_kcal - fat_kcal
     carb_g = round(max(0, carb_kcal / 4))
     
-    return {
-        "protein_g": int(protein_g),
-        "fat_g": int(fat_g),
-        "carb_g": int(carb_g),
-        "protein_kcal": int(protein_kcal),
-        "fat_kcal": int(fat_kcal),
-        "carb_kcal": int(carb_kcal),
-    }
+    # round() без ndigits уже возвращает int, дополнительные int() не нужны
+    return Macros(protein_g, fat_g, carb_g, protein_kcal, fat_kcal, carb_kcal)
 
 
 def calculate_water_ml(
@@ -133,20 +163,13 @@ def calculate_water_ml(
     base_ml = weight_kg * 35
     
     # Корректировка по активности
-    activity_multipliers = {
-        'sedentary': 0.95,
-        'light': 1.0,
-        'moderate': 1.0,
-        'high': 1.02,
-        'very_high': 1.05,
-    }
-    multiplier = activity_multipliers.get(activity, 1.0)
+    multiplier = _WATER_MULTIPLIERS.get(activity, 1.0)
     base_ml_adjusted = base_ml * multiplier
     
     # Дополнительно для тренировок: 400 мл на 60 минут
     extra_ml = (400 / 60) * training_minutes
     
-    water_ml = int(round(base_ml_adjusted + extra_ml))
+    water_ml = round(base_ml_adjusted + extra_ml)
     return water_ml
 
 
@@ -161,16 +184,30 @@ def parse_time(time_str: Optional[str]) -> Optional[time]:
         return None
 
 
+def _to_minutes(t: time) -> int:
+    """Минуты от полуночи"""
+    return t.hour * 60 + t.minute
+
+
+def _from_minutes(total: int) -> time:
+    """Время суток по минутам от полуночи (с переходом через полночь)"""
+    total %= _DAY_MINUTES
+    return time(total // 60, total % 60)
+
+
+def _fmt_hm(t: time) -> str:
+    """Форматирует время как 'HH:MM' без strftime"""
+    return f"{t.hour:02d}:{t.minute:02d}"
+
+
 def add_minutes(t: time, minutes: int) -> time:
     """Добавляет минуты к времени"""
-    dt = datetime.combine(datetime.today(), t)
-    dt += timedelta(minutes=minutes)
-    return dt.time()
+    return _from_minutes(_to_minutes(t) + minutes)
 
 
 def generate_meal_schedule(
     calories: int,
-    macros: dict[str, Any],
+    macros: Macros,
     wake_time: Optional[time] = None,
     work_start: Optional[time] = None,
     work_end: Optional[time] = None,
@@ -183,107 +220,45 @@ def generate_meal_schedule(
     Returns:
         Словарь с meals и pre_post_workout
     """
-    meals = []
-    
-    # Распределение калорий: завтрак 25%, обед 35%, ужин 30%, перекус 10%
-    breakfast_kcal = int(round(calories * 0.25))
-    lunch_kcal = int(round(calories * 0.35))
-    dinner_kcal = int(round(calories * 0.30))
-    snack_kcal = calories - breakfast_kcal - lunch_kcal - dinner_kcal
-    
-    # Распределение макронутриентов пропорционально
-    total_protein = macros['protein_g']
-    total_fat = macros['fat_g']
-    total_carb = macros['carb_g']
-    
-    breakfast_protein = int(round(total_protein * 0.25))
-    breakfast_fat = int(round(total_fat * 0.25))
-    breakfast_carb = int(round(total_carb * 0.25))
-    
-    lunch_protein = int(round(total_protein * 0.35))
-    lunch_fat = int(round(total_fat * 0.35))
-    lunch_carb = int(round(total_carb * 0.35))
-    
-    dinner_protein = int(round(total_protein * 0.30))
-    dinner_fat = int(round(total_fat * 0.30))
-    dinner_carb = int(round(total_carb * 0.30))
-    
-    snack_protein = total_protein - breakfast_protein - lunch_protein - dinner_protein
-    snack_fat = total_fat - breakfast_fat - lunch_fat - dinner_fat
-    snack_carb = total_carb - breakfast_carb - lunch_carb - dinner_carb
-    
-    # Время завтрака: через 30 минут после пробуждения
+    # Время приёмов пищи в минутах от полуночи
     if wake_time:
-        breakfast_time = add_minutes(wake_time, 30)
+        # Завтрак через 30 минут после пробуждения
+        breakfast_minutes = (_to_minutes(wake_time) + 30) % _DAY_MINUTES
+        # Ужин за 3 часа до сна, сон — 8 часов до пробуждения
+        dinner_minutes = (_to_minutes(wake_time) - 8 * 60 - 3 * 60) % _DAY_MINUTES
     else:
-        breakfast_time = time(8, 0)  # По умолчанию 08:00
-    
-    meals.append({
-        "name": "Breakfast",
-        "time": breakfast_time.strftime("%H:%M"),
-        "kcal": breakfast_kcal,
-        "protein_g": breakfast_protein,
-        "fat_g": breakfast_fat,
-        "carb_g": breakfast_carb,
-        "example": "Омлет с овощами, цельнозерновой тост",
-    })
-    
-    # Время обеда: середина рабочего дня или 13:00
+        breakfast_minutes = 8 * 60  # По умолчанию 08:00
+        dinner_minutes = 20 * 60  # По умолчанию 20:00
     if work_start and work_end:
-        # Середина рабочего дня
-        work_start_dt = datetime.combine(datetime.today(), work_start)
-        work_end_dt = datetime.combine(datetime.today(), work_end)
-        midpoint_dt = work_start_dt + (work_end_dt - work_start_dt) / 2
-        lunch_time = midpoint_dt.time()
-    else:
-        lunch_time = time(13, 0)  # По умолчанию 13:00
-    
-    meals.append({
-        "name": "Lunch",
-        "time": lunch_time.strftime("%H:%M"),
-        "kcal": lunch_kcal,
-        "protein_g": lunch_protein,
-        "fat_g": lunch_fat,
-        "carb_g": lunch_carb,
-        "example": "Запечённая курица, киноа, салат с оливковым маслом",
-    })
-    
-    # Время ужина: за 3 часа до сна (предполагаем сон в 23:00, если не указано)
-    if wake_time:
-        # Предполагаем 8 часов сна
-        bedtime = add_minutes(wake_time, -8 * 60)
-        dinner_time = add_minutes(bedtime, -3 * 60)
-    else:
-        dinner_time = time(20, 0)  # По умолчанию 20:00
-    
-    meals.append({
-        "name": "Dinner",
-        "time": dinner_time.strftime("%H:%M"),
-        "kcal": dinner_kcal,
-        "protein_g": dinner_protein,
-        "fat_g": dinner_fat,
-        "carb_g": dinner_carb,
-        "example": "Запечённый лосось с овощами",
-    })
-    
-    # Перекус: между обедом и ужином
-    if lunch_time and dinner_time:
-        snack_dt = datetime.combine(datetime.today(), lunch_time)
-        dinner_dt = datetime.combine(datetime.today(), dinner_time)
-        snack_dt = snack_dt + (dinner_dt - snack_dt) / 2
-        snack_time = snack_dt.time()
+        # Обед в середине рабочего дня
+        lunch_minutes = (_to_minutes(work_start) + _to_minutes(work_end)) // 2
     else:
-        snack_time = time(16, 0)  # По умолчанию 16:00
-    
-    meals.append({
-        "name": "Snack",
-        "time": snack_time.strftime("%H:%M"),
-        "kcal": snack_kcal,
-        "protein_g": snack_protein,
-        "fat_g": snack_fat,
-        "carb_g": snack_carb,
-        "example": "Греческий йогурт с ягодами",
-    })
+        lunch_minutes = 13 * 60  # По умолчанию 13:00
+    # Перекус между обедом и ужином
+    snack_minutes = (lunch_minutes + dinner_minutes) // 2
+    meal_minutes = (breakfast_minutes, lunch_minutes, dinner_minutes, snack_minutes)
+    
+    # Калории и макронутриенты делятся по долям _MEAL_SPLIT, последний приём получает остаток
+    totals = (calories, macros.protein_g, macros.fat_g, macros.carb_g)
+    remaining: tuple[int, ...] = totals
+    meals = []
+    for (name, share, example), minutes in zip(_MEAL_SPLIT, meal_minutes):
+        amounts: tuple[int, ...]
+        if share is None:
+            amounts = remaining
+        else:
+            amounts = tuple(round(total * share) for total in totals)
+            remaining = tuple(left - amount for left, amount in zip(remaining, amounts))
+        kcal, protein, fat, carb = amounts
+        meals.append({
+            "name": name,
+            "time": f"{minutes // 60:02d}:{minutes % 60:02d}",
+            "kcal": kcal,
+            "protein_g": protein,
+            "fat_g": fat,
+            "carb_g": carb,
+            "example": example,
+        })
     
     # Pre/post workout
     pre_workout = None
@@ -293,7 +268,7 @@ def generate_meal_schedule(
         # Pre-workout: за 30-60 минут до тренировки
         pre_time = add_minutes(training_time, -45)
         pre_workout = {
-            "time": pre_time.strftime("%H:%M"),
+            "time": _fmt_hm(pre_time),
             "type": "snack",
             "example": "Банан или небольшой энергетический батончик",
         }
@@ -301,7 +276,7 @@ def generate_meal_schedule(
         # Post-workout: через 30-60 минут после тренировки
         post_time = add_minutes(training_time, training_minutes + 30)
         post_workout = {
-            "time": post_time.strftime("%H:%M"),
+            "time": _fmt_hm(post_time),
             "type": "recovery",
             "example": "Протеиновый коктейль или куриная грудка с рисом",
         }
@@ -339,59 +314,52 @@ def generate_water_schedule(
         # Предполагаем 16 часов бодрствования
         bedtime = add_minutes(wake_time, 16 * 60)
     
-    # Рассчитываем интервал между напоминаниями
-    wake_dt = datetime.combine(datetime.today(), wake_time)
-    bed_dt = datetime.combine(datetime.today(), bedtime)
-    if bed_dt < wake_dt:
-        bed_dt += timedelta(days=1)
-    
-    total_minutes = int((bed_dt - wake_dt).total_seconds() / 60)
+    # Рассчитываем интервал между напоминаниями (отбой после полуночи — на следующие сутки)
+    wake_minutes = _to_minutes(wake_time)
+    total_minutes = (_to_minutes(bedtime) - wake_minutes) % _DAY_MINUTES
     interval_minutes = total_minutes // (n_reminders + 1)
     
     ml_per_reminder = water_ml // n_reminders
     
-    reminders = []
-    current_time = wake_time
-    for i in range(n_reminders):
-        current_time = add_minutes(current_time, interval_minutes)
-        reminders.append({
-            "time": current_time.strftime("%H:%M"),
-            "ml": ml_per_reminder,
-        })
-    
-    return reminders
+    return [
+        {"time": f"{m // 60:02d}:{m % 60:02d}", "ml": ml_per_reminder}
+        for m in ((wake_minutes + i * interval_minutes) % _DAY_MINUTES for i in range(1, n_reminders + 1))
+    ]
 
 
-def generate_nutrition_plan(profile: dict[str, Any]) -> dict[str, Any]:
+# Поля профиля, от которых зависит расчёт, и их значения по умолчанию
+_PLAN_INPUTS = (
+    ("sex", "m"),
+    ("age", 30),
+    ("weight_kg", None),
+    ("height_cm", None),
+    ("activity", "moderate"),
+    ("goal", "maintain"),
+    ("desired_wake_time", None),
+    ("work_start", None),
+    ("work_end", None),
+    ("training_minutes", 0),
+    ("training_time", None),
+)
+
+
+@lru_cache(maxsize=512)
+def _plan_core(key: tuple) -> bytes:
     """
-    Генерирует детальный план питания и гидратации.
+    Детерминированная часть плана для набора полей из _PLAN_INPUTS.
     
-    Args:
-        profile: Словарь с данными пользователя:
-            - sex: 'm'|'f'
-            - age: int
-            - weight_kg: float
-            - height_cm: float
-            - activity: 'sedentary'|'light'|'moderate'|'high'|'very_high'
-            - goal: 'maintain'|'lose'|'gain'
-            - desired_wake_time: 'HH:MM' (optional)
-            - work_start: 'HH:MM' (optional)
-            - work_end: 'HH:MM' (optional)
-            - training_minutes: int (optional)
-            - training_time: 'HH:MM' (optional)
-    
-    Returns:
-        Словарь с полным планом питания
+    Хранится сериализованной, чтобы каждый вызывающий получал собственную копию
+    и не мог испортить закэшированный результат.
     """
+    (
+        sex, age, weight_kg, height_cm, activity, goal,
+        desired_wake_time, work_start, work_end, training_minutes, training_time,
+    ) = key
+
     # Валидация входных данных
     warnings = []
     consult_clinician = False
     
-    age = profile.get('age', 30)
-    weight_kg = profile.get('weight_kg')
-    height_cm = profile.get('height_cm')
-    sex = profile.get('sex', 'm')
-    
     if not weight_kg or not height_cm:
         raise ValueError("weight_kg and height_cm are required")
     
@@ -411,25 +379,22 @@ def generate_nutrition_plan(profile: dict[str, Any]) -> dict[str, Any]:
     
     # Рассчитываем BMR и TDEE
     bmr = calculate_bmr(weight_kg, height_cm, age, sex)
-    activity = profile.get('activity', 'moderate')
     tdee = calculate_tdee(bmr, activity)
     
     # Рассчитываем целевые калории
-    goal = profile.get('goal', 'maintain')
     calories = calculate_target_calories(tdee, goal, age)
     
     # Рассчитываем макронутриенты
     macros = calculate_macros(calories, weight_kg, goal)
     
     # Рассчитываем воду
-    training_minutes = profile.get('training_minutes', 0)
     water_ml = calculate_water_ml(weight_kg, activity, training_minutes)
     
     # Генерируем расписание приёмов пищи
-    wake_time = parse_time(profile.get('desired_wake_time'))
-    work_start = parse_time(profile.get('work_start'))
-    work_end = parse_time(profile.get('work_end'))
-    training_time = parse_time(profile.get('training_time'))
+    wake_time = parse_time(desired_wake_time)
+    work_start = parse_time(work_start)
+    work_end = parse_time(work_end)
+    training_time = parse_time(training_time)
     
     meal_schedule = generate_meal_schedule(
         calories,
@@ -449,35 +414,126 @@ def generate_nutrition_plan(profile: dict[str, Any]) -> dict[str, Any]:
     
     water_reminders = generate_water_schedule(water_ml, wake_time, bedtime)
     
-    # Формируем результат
-    result = {
-        "meta": {
-            "timestamp": datetime.utcnow().isoformat(),
-            "input_profile": profile,
-            "warnings": warnings,
-            "consult_clinician": consult_clinician,
-            "deterministic_version": "mifflin_v1",
-        },
+    return orjson.dumps({
+        "warnings": warnings,
+        "consult_clinician": consult_clinician,
         "numbers": {
             "bmr": bmr,
             "tdee": tdee,
             "calories": calories,
-            "macros": macros,
+            "macros": macros._asdict(),
             "water_ml": water_ml,
         },
         "schedule": {
-            "wake_time": wake_time.strftime("%H:%M") if wake_time else None,
-            "bedtime": bedtime.strftime("%H:%M") if bedtime else None,
+            "wake_time": _fmt_hm(wake_time) if wake_time else None,
+            "bedtime": _fmt_hm(bedtime) if bedtime else None,
             "meals": meal_schedule["meals"],
             "water_reminders": water_reminders,
             "pre_post_workout": meal_schedule["pre_post_workout"],
         },
+    })
+
+
+def generate_nutrition_plan(profile: dict[str, Any]) -> dict[str, Any]:
+    """
+    Генерирует детальный план питания и гидратации.
+    
+    Args:
+        profile: Словарь с данными пользователя:
+            - sex: 'm'|'f'
+            - age: int
+            - weight_kg: float
+            - height_cm: float
+            - activity: 'sedentary'|'light'|'moderate'|'high'|'very_high'
+            - goal: 'maintain'|'lose'|'gain'
+            - desired_wake_time: 'HH:MM' (optional)
+            - work_start: 'HH:MM' (optional)
+            - work_end: 'HH:MM' (optional)
+            - training_minutes: int (optional)
+            - training_time: 'HH:MM' (optional)
+    
+    Returns:
+        Словарь с полным планом питания
+    """
+    # Всё, кроме meta, зависит только от перечисленных полей профиля и кэшируется
+    core = orjson.loads(_plan_core(_plan_key(profile)))
+    return _assemble_plan(profile, core, _plan_timestamp())
+
+
+def calculate_plan_numbers(profile: dict[str, Any]) -> dict[str, Any]:
+    """
+    Только блок numbers плана (BMR, TDEE, калории, БЖУ, вода) без meta.
+    
+    Берётся из того же кэша _plan_core, что и generate_nutrition_plan; невалидный профиль
+    так же вызывает ValueError.
+    """
+    return orjson.loads(_plan_core(_plan_key(profile)))["numbers"]
+
+
+def generate_nutrition_plans_batch(profiles: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Генерирует планы для набора профилей (ночной пересчёт, эксперименты).
+    
+    Профили, совпадающие по значимым полям, рассчитываются один раз, даже если пакет
+    больше LRU-кэша; все планы пакета получают общую метку времени.
+    Невалидный профиль, как и в generate_nutrition_plan, вызывает ValueError.
+    """
+    timestamp = _plan_timestamp()
+    cores: dict[tuple, bytes] = {}
+    plans = []
+    for profile in profiles:
+        key = _plan_key(profile)
+        blob = cores.get(key)
+        if blob is None:
+            blob = cores[key] = _plan_core(key)
+        plans.append(_assemble_plan(profile, orjson.loads(blob), timestamp))
+    return plans
+
+
+def _plan_key(profile: dict[str, Any]) -> tuple:
+    return tuple(profile.get(name, default) for name, default in _PLAN_INPUTS)
+
+
+def _plan_timestamp() -> str:
+    """Метка времени для meta.timestamp (наивное UTC, как и остальные даты в моделях)"""
+    return datetime.utcnow().isoformat()
+
+
+def _assemble_plan(profile: dict[str, Any], core: dict[str, Any], timestamp: str) -> dict[str, Any]:
+    return {
+        "meta": {
+            "timestamp": timestamp,
+            "input_profile": profile,
+            "warnings": core["warnings"],
+            "consult_clinician": core["consult_clinician"],
+            "deterministic_version": "mifflin_v1",
+        },
+        "numbers": core["numbers"],
+        "schedule": core["schedule"],
         "llm_prompt": "",  # Будет заполнено при вызове LLM
         "llm_response": None,
         "human_text": "",
     }
-    
-    return result
+
+
+# Ответы LLM на промпты обогащения плана; кэшируется сырой текст, чтобы каждый вызов разбирал свою копию
+_enrich_cache = ResponseCache(maxsize=1024, ttl_seconds=3600)
+
+
+def _dumps(value: Any) -> str:
+    """JSON для промпта: с отступами, кириллица без экранирования"""
+    return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode()
+
+
+def _fallback_text(plan: dict[str, Any]) -> str:
+    """Краткое описание плана без LLM"""
+    numbers = plan["numbers"]
+    macros = numbers["macros"]
+    return (
+        f"Ваш план: {numbers['calories']} ккал, "
+        f"Б/Ж/У {macros['protein_g']}/{macros['fat_g']}/{macros['carb_g']} г, "
+        f"вода {numbers['water_ml']} мл."
+    )
 
 
 async def enrich_with_llm(plan: dict[str, Any]) -> dict[str, Any]:
@@ -491,11 +547,7 @@ async def enrich_with_llm(plan: dict[str, Any]) -> dict[str, Any]:
         План с добавленными llm_prompt и llm_response
     """
     if not llm_client.enabled:
-        plan["human_text"] = (
-            f"Ваш план: {plan['numbers']['calories']} ккал, "
-            f"Б/Ж/У {plan['numbers']['macros']['protein_g']}/{plan['numbers']['macros']['fat_g']}/{plan['numbers']['macros']['carb_g']} г, "
-            f"вода {plan['numbers']['water_ml']} мл."
-        )
+        plan["human_text"] = _fallback_text(plan)
         return plan
     
     # Формируем промпт для LLM
@@ -507,10 +559,10 @@ async def enrich_with_llm(plan: dict[str, Any]) -> dict[str, Any]:
         "and avoid giving prescriptive plans."
     )
     
-    user_prompt = f"""Context: {json.dumps(plan['meta']['input_profile'], ensure_ascii=False, indent=2)}
+    user_prompt = f"""Context: {_dumps(plan['meta']['input_profile'])}
 
-Deterministic results: {json.dumps(plan['numbers'], ensure_ascii=False, indent=2)}
-Schedule: {json.dumps(plan['schedule'], ensure_ascii=False, indent=2)}
+Deterministic results: {_dumps(plan['numbers'])}
+Schedule: {_dumps(plan['schedule'])}
 
 TASKS:
 1) Produce a 2-4 sentence user-friendly summary reporting calories, macros and water.
@@ -527,33 +579,35 @@ Return only JSON."""
         if not llm_client._client:
             raise ValueError("LLM client not available")
         
-        import asyncio
-        response = await asyncio.to_thread(
-            llm_client._client.chat.completions.create,
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-        )
-        
-        content = response.choices[0].message.content.strip()
+        # Одинаковый профиль даёт одинаковый промпт — повторно в OpenAI не ходим
+        cache_key = ResponseCache.make_key(system_prompt, user_prompt)
+        content = _enrich_cache.get(cache_key)
+        if content is None:
+            response = await llm_client._client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+            )
+            content = (response.choices[0].message.content or "").strip()
         # Пытаемся распарсить JSON из ответа
         try:
-            llm_json = json.loads(content)
+            llm_json = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            llm_json = None
+        if isinstance(llm_json, dict):
+            # В кэш попадает только разобравшийся ответ, пустой или сырой текст запросим снова
+            _enrich_cache.set(cache_key, content)
             plan["llm_response"] = llm_json
             plan["human_text"] = llm_json.get("summary", plan["human_text"])
-        except json.JSONDecodeError:
-            # Если не JSON, используем как есть
+        else:
+            # Если не JSON-объект, используем как есть
             plan["llm_response"] = {"raw": content}
             plan["human_text"] = content
-    except Exception:
+    except (OpenAIError, ValueError):
         # В случае ошибки используем базовый текст
-        plan["human_text"] = (
-            f"Ваш план: {plan['numbers']['calories']} ккал, "
-            f"Б/Ж/У {plan['numbers']['macros']['protein_g']}/{plan['numbers']['macros']['fat_g']}/{plan['numbers']['macros']['carb_g']} г, "
-            f"вода {plan['numbers']['water_ml']} мл."
-        )
+        plan["human_text"] = _fallback_text(plan)
     
     return plan
 
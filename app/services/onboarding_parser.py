@@ -1,16 +1,16 @@
 from __future__ import annotations
 
 import re
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from datetime import datetime, time
-from typing import Any, Optional
-
-from dateutil import parser as date_parser
+from typing import Any, Iterable, Optional
 
 from app.services.llm import llm_client
 
 TIME_REGEX = re.compile(r"(?P<hour>\d{1,2}):(?P<minute>\d{2})")
 NUMBER_REGEX = re.compile(r"\d+(?:[.,]\d+)?")
+# Типичный ответ LLM: "07:30", "7:30 pm" — разбираем без dateutil
+_SIMPLE_TIME_RE = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*(am|pm)?\s*$", re.IGNORECASE)
 
 WEEKDAY_ALIASES = {
     "пн": "mon",
@@ -22,6 +22,111 @@ WEEKDAY_ALIASES = {
     "вс": "sun",
 }
 
+# Подстрока -> идентификатор цели; несколько подстрок могут давать одну цель
+_GOAL_KEYWORDS = (
+    ("похуд", "weight_loss"),
+    ("сниж", "weight_loss"),
+    ("вес", "weight_loss"),
+    ("мышц", "muscle_gain"),
+    ("масс", "muscle_gain"),
+    ("энерг", "energy"),
+    ("бодр", "energy"),
+    ("сон", "sleep"),
+    ("питани", "nutrition"),
+    ("тренировк", "training"),
+)
+
+# Поля анкеты, без которых профиль считается неполным и уточняется через LLM.
+# Цели сюда не входят: эвристика находит их почти в любом тексте (например, "вес" -> weight_loss).
+_REQUIRED_PROFILE_FIELDS = (
+    "desired_wake_time",
+    "sleep_goal_minutes",
+    "height_cm",
+    "weight_kg",
+    "age",
+    "sex",
+    "work_start",
+    "work_end",
+)
+
+
+@dataclass(frozen=True, slots=True)
+class _PatternUnion:
+    """
+    Несколько шаблонов, объединённых в одну регулярку с сохранением приоритета.
+
+    Ветка `^.*?(шаблон)` пробуется по всей строке раньше следующей, поэтому результат тот же,
+    что у последовательных search по списку: первый шаблон, нашедшийся хоть где-то, побеждает.
+    """
+
+    regex: re.Pattern[str]
+    sizes: tuple[int, ...]
+
+    @classmethod
+    def of(cls, *patterns: str) -> "_PatternUnion":
+        compiled = [re.compile(pattern) for pattern in patterns]
+        return cls(
+            regex=re.compile("|".join(f"^.*?({c.pattern})" for c in compiled), re.DOTALL),
+            sizes=tuple(c.groups for c in compiled),
+        )
+
+    def search(self, text: str) -> Optional[tuple[str, ...]]:
+        """
+        Возвращает (совпавший текст, группы сработавшего шаблона...) или None.
+        Несработавшие необязательные группы приходят пустыми строками, а не None.
+        """
+        match = self.regex.search(text)
+        if not match:
+            return None
+        groups = match.groups()
+        offset = 0
+        for size in self.sizes:
+            if groups[offset] is not None:
+                return tuple(group or "" for group in groups[offset:offset + size + 1])
+            offset += size + 1
+        return None
+
+
+# Шаблоны heuristic_parse компилируются один раз при импорте.
+# Там, где срабатывает первый же найденный шаблон, они объединены в один проход
+_WAKE_RE = _PatternUnion.of(
+    r"встаю?\s+в\s+(\d{1,2}):?(\d{2})?",
+    r"подъ[её]м\s+в\s+(\d{1,2}):?(\d{2})?",
+    r"(\d{1,2}):?(\d{2})?\s+утра",
+    r"(\d{1,2}):?(\d{2})?\s+утром",
+)
+_SLEEP_PATTERNS = (
+    re.compile(r"сплю\s+(\d+(?:[.,]\d+)?)\s*ч"),
+    re.compile(r"(\d+(?:[.,]\d+)?)\s*ч(?:ас(?:ов|а)?)?\s+сна"),
+)
+_HEIGHT_PATTERNS = (
+    re.compile(r"рост\s*(\d+(?:[.,]\d+)?)"),
+    re.compile(r"(\d+(?:[.,]\d+)?)\s*см"),
+)
+_WEIGHT_PATTERNS = (
+    re.compile(r"вес\s*(\d+(?:[.,]\d+)?)"),
+    re.compile(r"(\d+(?:[.,]\d+)?)\s*кг"),
+)
+_AGE_PATTERNS = (
+    re.compile(r"(\d{1,2})\s*лет"),
+    re.compile(r"возраст\s*(\d{1,2})"),
+    re.compile(r"мне\s*(\d{1,2})"),
+)
+_MULTI_DAY_RE = re.compile(r"([пвс][нт])(?:/([пвс][нт]))+(?:\s+в\s+)?(\d{1,2}:\d{2})")
+_WEEKDAY_PATTERNS = tuple(
+    (eng, re.compile(rf"{alias}\s*(\d{{1,2}}:\d{{2}})")) for alias, eng in WEEKDAY_ALIASES.items()
+)
+_WATER_RE = _PatternUnion.of(
+    r"(\d+(?:[.,]\d+)?)\s*л(?:итров?|итра)?",
+    r"(\d{3,4})\s*мл",
+)
+_WORK_RE = _PatternUnion.of(
+    r"(?:работаю\s+)?с\s+(\d{1,2}):?(\d{2})?\s+до\s+(\d{1,2}):?(\d{2})?",
+    r"(\d{1,2}):?(\d{2})?\s*[-–]\s*(\d{1,2}):?(\d{2})?",
+    r"работаю\s+(\d{1,2}):?(\d{2})?\s+(\d{1,2}):?(\d{2})?",
+)
+_SENTENCE_SPLIT_RE = re.compile(r"[.!]")
+
 
 @dataclass(slots=True)
 class ParsedProfile:
@@ -40,11 +145,35 @@ class ParsedProfile:
     goals: list[str] = field(default_factory=list)
 
 
+def _simple_time(value: str) -> Optional[time]:
+    """Быстрый разбор "ЧЧ:ММ [am|pm]"; None, если формат не подошёл."""
+    match = _SIMPLE_TIME_RE.match(value)
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    meridiem = match.group(3)
+    if minute > 59:
+        return None
+    if meridiem is None:
+        return time(hour=hour, minute=minute) if hour <= 23 else None
+    if not 1 <= hour <= 12:
+        return None
+    hour %= 12
+    if meridiem.lower() == "pm":
+        hour += 12
+    return time(hour=hour, minute=minute)
+
+
 def _to_time(value: str) -> Optional[time]:
     if not value:
         return None
+    simple = _simple_time(value) if isinstance(value, str) else None
+    if simple is not None:
+        return simple
     try:
-        # Пытаемся распарсить через dateutil
+        # Пытаемся распарсить через dateutil; импортируем лениво, он тяжёлый
+        from dateutil import parser as date_parser
+
         parsed = date_parser.parse(value, default=datetime(2000, 1, 1))
         result = parsed.time().replace(second=0, microsecond=0)
         # Если час >= 20 и нет явного указания "вечера", но есть "утра" в исходном тексте,
@@ -69,37 +198,30 @@ def _to_time(value: str) -> Optional[time]:
 def heuristic_parse(text: str) -> ParsedProfile:
     data = ParsedProfile()
     lowered = text.lower()
+    # Все числа текста нужны сразу нескольким fallback-веткам (сон, рост/вес)
+    numbers = [float(num.replace(",", ".")) for num in NUMBER_REGEX.findall(text)]
 
     # Парсим время подъёма с учётом контекста "утра" / "вечера"
-    wake_patterns = [
-        re.compile(r"встаю?\s+в\s+(\d{1,2}):?(\d{2})?"),
-        re.compile(r"подъ[её]м\s+в\s+(\d{1,2}):?(\d{2})?"),
-        re.compile(r"(\d{1,2}):?(\d{2})?\s+утра"),
-        re.compile(r"(\d{1,2}):?(\d{2})?\s+утром"),
-    ]
     is_morning_context = "утра" in lowered or "утром" in lowered
     is_evening_context = "вечера" in lowered or "вечером" in lowered
     
-    for pattern in wake_patterns:
-        match = pattern.search(lowered)
-        if match:
-            hour = int(match.group(1))
-            minute = int(match.group(2)) if match.group(2) else 0
-            # Если указано "утра" или "утром", час остаётся как есть (0-11)
-            # Если указано "вечера" или "вечером", добавляем 12 к часам (если < 12)
-            if is_morning_context:
-                # "8 утра" = 08:00
-                data.desired_wake_time = time(hour=hour % 12 if hour >= 12 else hour, minute=minute % 60)
-            elif is_evening_context:
-                # "8 вечера" = 20:00
-                data.desired_wake_time = time(hour=(hour % 12) + 12 if hour < 12 else hour, minute=minute % 60)
-            else:
-                # По умолчанию: если час 1-11, считаем утро; если 12+, считаем как есть
-                if 1 <= hour <= 11:
-                    data.desired_wake_time = time(hour=hour, minute=minute % 60)
-                else:
-                    data.desired_wake_time = time(hour=hour % 24, minute=minute % 60)
-            break
+    wake_match = _WAKE_RE.search(lowered)
+    if wake_match:
+        _, hour_str, minute_str = wake_match
+        hour = int(hour_str)
+        minute = int(minute_str) if minute_str else 0
+        # Если указано "утра" или "утром", час остаётся как есть (0-11)
+        # Если указано "вечера" или "вечером", добавляем 12 к часам (если < 12)
+        if is_morning_context:
+            # "8 утра" = 08:00, "12 утра" = 00:00
+            hour %= 12
+        elif is_evening_context:
+            # "8 вечера" = 20:00
+            hour += 12 if hour < 12 else 0
+        else:
+            # По умолчанию час как есть: 1-11 — утро, 12+ — по 24-часовым часам
+            hour %= 24
+        data.desired_wake_time = time(hour=hour, minute=minute % 60)
     
     # Если не нашли через паттерны, пробуем просто первое время
     if not data.desired_wake_time:
@@ -109,16 +231,9 @@ def heuristic_parse(text: str) -> ParsedProfile:
             hour = int(first[0])
             minute = int(first[1])
             # По умолчанию для часов 1-11 считаем утро, для 12+ - как есть (может быть вечер)
-            if 1 <= hour <= 11:
-                data.desired_wake_time = time(hour=hour, minute=minute)
-            else:
-                data.desired_wake_time = time(hour=hour % 24, minute=minute)
+            data.desired_wake_time = time(hour=hour % 24, minute=minute)
     # Парсим цель сна: "сплю 8 часов" или "8 ч" или "8 часов"
-    sleep_patterns = [
-        re.compile(r"сплю\s+(\d+(?:[.,]\d+)?)\s*ч"),
-        re.compile(r"(\d+(?:[.,]\d+)?)\s*ч(?:ас(?:ов|а)?)?\s+сна"),
-    ]
-    for pattern in sleep_patterns:
+    for pattern in _SLEEP_PATTERNS:
         sleep_match = pattern.search(lowered)
         if sleep_match:
             hours = float(sleep_match.group(1).replace(",", "."))
@@ -127,26 +242,13 @@ def heuristic_parse(text: str) -> ParsedProfile:
                 break
     # Fallback: ищем числа в диапазоне 4-10
     if not data.sleep_goal_minutes:
-        matches = NUMBER_REGEX.findall(text)
-        numbers = [float(num.replace(",", ".")) for num in matches]
-        if numbers:
-            hours = next((num for num in numbers if 4 <= num <= 10), None)
-            if hours:
-                data.sleep_goal_minutes = int(hours * 60)
+        hours = next((num for num in numbers if 4 <= num <= 10), None)
+        if hours:
+            data.sleep_goal_minutes = int(hours * 60)
     # Парсим рост и вес с учетом контекста
     if "рост" in lowered or "вес" in lowered:
-        # Ищем паттерны "рост X" и "вес Y"
-        height_patterns = [
-            re.compile(r"рост\s*(\d+(?:[.,]\d+)?)"),
-            re.compile(r"(\d+(?:[.,]\d+)?)\s*см"),
-        ]
-        weight_patterns = [
-            re.compile(r"вес\s*(\d+(?:[.,]\d+)?)"),
-            re.compile(r"(\d+(?:[.,]\d+)?)\s*кг"),
-        ]
-        
-        # Сначала ищем по паттернам с контекстом
-        for pattern in height_patterns:
+        # Сначала ищем по паттернам с контекстом "рост X" / "X см"
+        for pattern in _HEIGHT_PATTERNS:
             match = pattern.search(lowered)
             if match:
                 height_val = float(match.group(1).replace(",", "."))
@@ -154,7 +256,7 @@ def heuristic_parse(text: str) -> ParsedProfile:
                     data.height_cm = int(height_val)
                     break
         
-        for pattern in weight_patterns:
+        for pattern in _WEIGHT_PATTERNS:
             match = pattern.search(lowered)
             if match:
                 weight_val = float(match.group(1).replace(",", "."))
@@ -183,12 +285,7 @@ def heuristic_parse(text: str) -> ParsedProfile:
                 data.weight_kg = maybe_weight
     
     # Парсим возраст
-    age_patterns = [
-        re.compile(r"(\d{1,2})\s*лет"),
-        re.compile(r"возраст\s*(\d{1,2})"),
-        re.compile(r"мне\s*(\d{1,2})"),
-    ]
-    for pattern in age_patterns:
+    for pattern in _AGE_PATTERNS:
         age_match = pattern.search(lowered)
         if age_match:
             age = int(age_match.group(1))
@@ -197,16 +294,16 @@ def heuristic_parse(text: str) -> ParsedProfile:
                 break
     
     # Парсим пол
-    if "муж" in lowered or "парень" in lowered or "m" in lowered.lower():
+    if "муж" in lowered or "парень" in lowered or "m" in lowered:
         data.sex = "m"
-    elif "жен" in lowered or "девушка" in lowered or "f" in lowered.lower():
+    elif "жен" in lowered or "девушка" in lowered or "f" in lowered:
         data.sex = "f"
     if "аллер" in lowered:
         start = lowered.find("аллер")
         data.allergies = text[start:].split(".")[0].strip()
     # Парсим тренировки: "пн/ср/пт в 20:00" или "пн 20:00, ср 20:00"
     # Сначала ищем паттерн "пн/ср/пт в 20:00"
-    multi_day_match = re.search(r"([пвс][нт])(?:/([пвс][нт]))+(?:\s+в\s+)?(\d{1,2}:\d{2})", lowered)
+    multi_day_match = _MULTI_DAY_RE.search(lowered)
     if multi_day_match:
         base_day = multi_day_match.group(1)
         time_str = multi_day_match.group(3)
@@ -217,70 +314,68 @@ def heuristic_parse(text: str) -> ParsedProfile:
                 data.workouts.append({"day": WEEKDAY_ALIASES[day_abbr], "time": time_str})
     else:
         # Обычный паттерн: "пн 20:00, ср 20:00"
-        for alias, eng in WEEKDAY_ALIASES.items():
-            pattern = re.compile(rf"{alias}\s*(\d{{1,2}}:\d{{2}})")
+        for eng, pattern in _WEEKDAY_PATTERNS:
             for match in pattern.findall(lowered):
                 data.workouts.append({"day": eng, "time": match})
     if "вода" in lowered:
         # Парсим "2 литра" или "2000 мл" или "2л"
-        water_patterns = [
-            re.compile(r"(\d+(?:[.,]\d+)?)\s*л(?:итров?|итра)?"),
-            re.compile(r"(\d{3,4})\s*мл"),
-        ]
-        for pattern in water_patterns:
-            water_match = pattern.search(lowered)
-            if water_match:
-                value = float(water_match.group(1).replace(",", "."))
-                if "л" in water_match.group(0).lower():
-                    data.hydration_goal_ml = int(value * 1000)
-                else:
-                    data.hydration_goal_ml = int(value)
-                break
+        water_match = _WATER_RE.search(lowered)
+        if water_match:
+            matched, amount = water_match
+            value = float(amount.replace(",", "."))
+            if "л" in matched:
+                data.hydration_goal_ml = int(value * 1000)
+            else:
+                data.hydration_goal_ml = int(value)
     # Парсим рабочие часы: "работаю с 9 до 18" или "9-18" или "09:00-18:00" или "с 9 до 18"
-    work_patterns = [
-        re.compile(r"(?:работаю\s+)?с\s+(\d{1,2}):?(\d{2})?\s+до\s+(\d{1,2}):?(\d{2})?"),
-        re.compile(r"(\d{1,2}):?(\d{2})?\s*[-–]\s*(\d{1,2}):?(\d{2})?"),
-        re.compile(r"работаю\s+(\d{1,2}):?(\d{2})?\s+(\d{1,2}):?(\d{2})?"),
-    ]
-    for pattern in work_patterns:
-        work_match = pattern.search(lowered)
-        if work_match:
-            start_hour = int(work_match.group(1))
-            start_min = int(work_match.group(2)) if work_match.group(2) else 0
-            end_hour = int(work_match.group(3))
-            end_min = int(work_match.group(4)) if len(work_match.groups()) >= 4 and work_match.group(4) else 0
-            data.work_start = time(hour=start_hour % 24, minute=start_min % 60)
-            data.work_end = time(hour=end_hour % 24, minute=end_min % 60)
-            break
+    work_match = _WORK_RE.search(lowered)
+    if work_match:
+        _, start_hour, start_min, end_hour, end_min = work_match
+        data.work_start = time(hour=int(start_hour) % 24, minute=int(start_min or 0) % 60)
+        data.work_end = time(hour=int(end_hour) % 24, minute=int(end_min or 0) % 60)
     # Парсим цели: "хочу похудеть", "снижение веса", "набор мышц", "энергия"
-    goal_keywords = {
-        "похуд": "weight_loss",
-        "сниж": "weight_loss",
-        "вес": "weight_loss",
-        "мышц": "muscle_gain",
-        "масс": "muscle_gain",
-        "энерг": "energy",
-        "бодр": "energy",
-        "сон": "sleep",
-        "питани": "nutrition",
-        "тренировк": "training",
-    }
-    detected_goals = []
-    for keyword, goal_id in goal_keywords.items():
-        if keyword in lowered:
-            detected_goals.append(goal_id)
+    detected_goals = {goal_id for keyword, goal_id in _GOAL_KEYWORDS if keyword in lowered}
     if detected_goals:
-        data.goals = list(set(detected_goals))
+        data.goals = list(detected_goals)
     elif "goal" in lowered or "цель" in lowered:
-        sentences = [s.strip() for s in re.split(r"[.!]", text) if "цель" in s.lower()]
+        sentences = [s.strip() for s in _SENTENCE_SPLIT_RE.split(text) if "цель" in s.lower()]
         if sentences:
             data.goals = [sentences[0]]
     return data
 
 
+def heuristic_parse_many(texts: Iterable[str]) -> list[ParsedProfile]:
+    """
+    Эвристический разбор набора анкет (админ-инструменты, повторная обработка истории).
+    
+    Одинаковые тексты разбираются один раз; каждый элемент результата — отдельный объект,
+    поэтому их можно дополнять независимо.
+    """
+    parsed: dict[str, ParsedProfile] = {}
+    results = []
+    for text in texts:
+        profile = parsed.get(text)
+        if profile is None:
+            profile = parsed[text] = heuristic_parse(text)
+            results.append(profile)
+        else:
+            results.append(
+                replace(profile, workouts=[dict(item) for item in profile.workouts], goals=list(profile.goals))
+            )
+    return results
+
+
+def _is_complete(parsed: ParsedProfile) -> bool:
+    # Тренировки и рабочие часы без LLM теряются, поэтому без них запрос не пропускаем
+    return bool(parsed.workouts) and all(
+        getattr(parsed, name) is not None for name in _REQUIRED_PROFILE_FIELDS
+    )
+
+
 async def parse_freeform_profile(text: str) -> ParsedProfile:
     parsed = heuristic_parse(text)
-    if llm_client.enabled:
+    # Эвристика уже заполнила всё нужное — запрос к LLM ничего не добавит, кроме задержки
+    if llm_client.enabled and not _is_complete(parsed):
         try:
             llm_data = await llm_client.parse_profile(text)
             
@@ -4,8 +4,8 @@ from typing import Optional
 
 from app.models import User
 from app.services.nutrition_calculator import (
+    calculate_plan_numbers,
     calculate_water_ml,
-    generate_nutrition_plan,
 )
 
 
@@ -41,16 +41,16 @@ def estimate_calories(user: User) -> Optional[dict]:
         "goal": goal,
     }
     
-    # Используем новый модуль
-    plan = generate_nutrition_plan(profile)
+    # Нужны только числа: они берутся из кэша расчёта плана, полный план не собирается
+    numbers = calculate_plan_numbers(profile)
     
     # Форматируем макронутриенты для обратной совместимости
-    macros = plan["numbers"]["macros"]
+    macros = numbers["macros"]
     macro_str = f"Б/Ж/У {macros['protein_g']}/{macros['fat_g']}/{macros['carb_g']} г"
     
     return {
-        "maintenance": plan["numbers"]["tdee"],
-        "target": plan["numbers"]["calories"],
+        "maintenance": numbers["tdee"],
+        "target": numbers["calories"],
         "macro": macro_str,
     }
 
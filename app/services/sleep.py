@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from datetime import date, datetime, time, timedelta
+from datetime import time, timedelta
+from functools import lru_cache
 from typing import Iterable, Sequence
 
 from app.models import SleepLog, User
 
+CHRONOTHERAPY_MAX_DAYS = 15
+
 
 @dataclass(slots=True)
 class BedtimePlan:
@@ -29,6 +32,8 @@ def calculate_sleep_goal_minutes(user: User) -> int:
     return 450
 
 
+# Чистая функция от (время подъёма, цель сна): ключей не больше 1440 × число разных целей
+@lru_cache(maxsize=4096)
 def calculate_bedtime(desired_wake: time, goal_minutes: int) -> time:
     total_wake_minutes = desired_wake.hour * 60 + desired_wake.minute
     bedtime_minutes = (total_wake_minutes - goal_minutes) % (24 * 60)
@@ -40,34 +45,39 @@ def suggest_chronotherapy(
     target_bedtime: time,
     step_minutes: int = 30,
 ) -> list[tuple[int, time]]:
+    if not 0 < step_minutes <= 12 * 60:
+        raise ValueError("step_minutes must be between 1 and 720")
     current = current_bedtime.hour * 60 + current_bedtime.minute
     target = target_bedtime.hour * 60 + target_bedtime.minute
-    plan: list[tuple[int, time]] = []
-    day_offset = 0
-
-    while current != target:
-        if (target - current) % (24 * 60) > (12 * 60):
-            # move backwards across midnight
-            current = (current - step_minutes) % (24 * 60)
-        else:
-            current = (current + step_minutes) % (24 * 60)
-        day_offset += 1
-        plan.append((day_offset, minutes_to_time(current)))
-        if day_offset > 14:  # safety guard
-            break
-    return plan
+    forward = (target - current) % (24 * 60)
+    if forward > 12 * 60:
+        # move backwards across midnight
+        direction, distance = -1, 24 * 60 - forward
+    else:
+        direction, distance = 1, forward
+    full_steps, remainder = divmod(distance, step_minutes)
+    steps = list(range(1, min(full_steps, CHRONOTHERAPY_MAX_DAYS) + 1))
+    if remainder:
+        # Цель не кратна шагу: после последнего полного шага план колеблется вокруг неё
+        steps += [
+            full_steps + 1 if i % 2 == 0 else full_steps
+            for i in range(CHRONOTHERAPY_MAX_DAYS - len(steps))
+        ]
+    return [
+        (day_offset, minutes_to_time(current + direction * step_minutes * k))
+        for day_offset, k in enumerate(steps, start=1)
+    ]
 
 
 def build_bedtime_plan(user: User) -> BedtimePlan:
     goal_minutes = calculate_sleep_goal_minutes(user)
     wake = user.desired_wake_time
-    bedtime = calculate_bedtime(wake, goal_minutes)
-    duration = timedelta(minutes=goal_minutes)
+    has_debt = user.sleep_debt_minutes > 60
+    # Длительность считаем в минутах: отбой и timedelta строятся по ней один раз
+    extra = min(120, ((user.sleep_debt_minutes + 29) // 30) * 30) if has_debt else 0
+    bedtime = calculate_bedtime(wake, goal_minutes + extra)
     notes = "Рекомендуется поддерживать одинаковое время отхода ко сну и подъёма ежедневно."
-    if user.sleep_debt_minutes > 60:
-        extra = min(120, ((user.sleep_debt_minutes + 29) // 30) * 30)
-        duration += timedelta(minutes=extra)
-        bedtime = calculate_bedtime(wake, int(duration.total_seconds() // 60))
+    if has_debt:
         notes = (
             "Обнаружен накопленный sleep debt. Временно увеличьте продолжительность сна "
             f"на {extra // 60} ч {extra % 60} мин и поддерживайте режим как минимум 3 дня."
@@ -78,7 +88,12 @@ def build_bedtime_plan(user: User) -> BedtimePlan:
             "Текущий режим сна сильно отличается от цели. Следуйте постепенному сдвигу:\n"
             + ", ".join(f"+{day} дн → {bt.strftime('%H:%M')}" for day, bt in plan)
         )
-    return BedtimePlan(target_bedtime=bedtime, wake_time=wake, sleep_duration=duration, notes=notes)
+    return BedtimePlan(
+        target_bedtime=bedtime,
+        wake_time=wake,
+        sleep_duration=timedelta(minutes=goal_minutes + extra),
+        notes=notes,
+    )
 
 
 def _diff_minutes(a: time, b: time) -> int:
@@ -93,13 +108,12 @@ def _diff_minutes(a: time, b: time) -> int:
 
 
 def compute_sleep_debt(logs: Sequence[SleepLog], goal_minutes: int) -> int:
-    debt = 0
-    for log in logs:
-        if log.duration_minutes is None:
-            continue
-        delta = goal_minutes - log.duration_minutes
-        debt += max(0, delta)
-    return debt
+    # Учитываем только недосып: ночи без данных и ночи длиннее цели долг не меняют
+    return sum(
+        goal_minutes - duration
+        for duration in (log.duration_minutes for log in logs)
+        if duration is not None and duration < goal_minutes
+    )
 
 
 def record_sleep_log(
@@ -108,18 +122,15 @@ def record_sleep_log(
     wake_time: time,
     log_repo,
 ) -> SleepLog:
+    # Подъём раньше отбоя по часам означает, что сон пересёк полночь
     duration = (
-        (datetime.combine(date.today(), wake_time) - datetime.combine(date.today(), bedtime))
-        .total_seconds()
-        / 60
-    )
-    if duration < 0:
-        duration += 24 * 60
+        (wake_time.hour * 60 + wake_time.minute) - (bedtime.hour * 60 + bedtime.minute)
+    ) % (24 * 60)
     log = SleepLog(
         user_id=user.telegram_id,
         bedtime=bedtime,
         wake_time=wake_time,
-        duration_minutes=int(duration),
+        duration_minutes=duration,
     )
     log_repo.append(log)
     return log
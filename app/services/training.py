@@ -31,16 +31,18 @@ def _parse_time(value: str) -> time:
 
 
 def plan_week_sessions(user: User, today: date) -> list[datetime]:
-    schedule = []
+    # Сортируем смещения в минутах от начала сегодняшнего дня и только потом строим datetime
+    today_weekday = today.weekday()
+    offsets = []
     for day_info in user.workout_days:
         weekday = WEEKDAY_INDEX.get(day_info.get("day", "").lower())
         if weekday is None:
             continue
-        occurs_in = (weekday - today.weekday()) % 7
-        target_date = today + timedelta(days=occurs_in)
         when = _parse_time(day_info.get("time", "19:00"))
-        schedule.append(datetime.combine(target_date, when))
-    return sorted(schedule)
+        offsets.append(((weekday - today_weekday) % 7) * 1440 + when.hour * 60 + when.minute)
+    offsets.sort()
+    start = datetime.combine(today, time())
+    return [start + timedelta(minutes=offset) for offset in offsets]
 
 
 def mark_training(session: TrainingSession, status: TrainingStatus) -> TrainingSession:
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.llm import ResponseCache, llm_client
+
+
+class FakeCompletions:
+    """Подмена chat.completions: отвечает reply (или фрагментами chunks при stream=True) и копит вызовы."""
+
+    def __init__(self) -> None:
+        self.calls: list[dict] = []
+        self.reply: str | None = "{}"
+        self.chunks: list[str] = []
+        self.error: Exception | None = None
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.error is not None:
+            raise self.error
+        if kwargs.get("stream"):
+            return self._stream()
+        message = SimpleNamespace(content=self.reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def _stream(self):
+        for text in self.chunks:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+@pytest.fixture
+def fake_completions(monkeypatch) -> FakeCompletions:
+    """Включает общий llm_client с фейковым OpenAI-клиентом и пустыми кэшами."""
+    completions = FakeCompletions()
+    monkeypatch.setattr(llm_client, "enabled", True)
+    monkeypatch.setattr(llm_client, "_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    for name in ("_ask_cache", "_summary_cache", "_parse_cache"):
+        monkeypatch.setattr(llm_client, name, ResponseCache())
+    return completions
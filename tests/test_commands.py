@@ -0,0 +1,41 @@
+from aiogram.exceptions import TelegramBadRequest
+
+from app.bot.routers.commands import _answer_streaming
+
+
+class FakeMessage:
+    """Сообщение Telegram: запоминает отправки и правки вместе с parse_mode."""
+
+    def __init__(self, not_modified: bool = False) -> None:
+        self.calls: list[tuple[str, str, object]] = []
+        self.not_modified = not_modified
+
+    async def answer(self, text, **kwargs):
+        self.calls.append(("answer", text, kwargs.get("parse_mode", "default")))
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        parse_mode = kwargs.get("parse_mode", "default")
+        self.calls.append(("edit", text, parse_mode))
+        if self.not_modified and parse_mode == "default":
+            raise TelegramBadRequest(method=None, message="Bad Request: message is not modified")
+        return self
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def test_answer_streaming_formats_only_final_edit():
+    message = FakeMessage()
+    await _answer_streaming(message, _chunks("Спите <b", ">8</b> часов", "\n\nДисклеймер"))
+    assert message.calls[0] == ("answer", "Спите <b", None)
+    assert all(parse_mode is None for _, _, parse_mode in message.calls[:-1])
+    assert message.calls[-1] == ("edit", "Спите <b>8</b> часов\n\nДисклеймер", "default")
+
+
+async def test_answer_streaming_ignores_not_modified_on_final_edit():
+    message = FakeMessage(not_modified=True)
+    await _answer_streaming(message, _chunks("Готово"))
+    assert message.calls == [("answer", "Готово", None), ("edit", "Готово", "default")]
@@ -0,0 +1,147 @@
+import asyncio
+from datetime import time
+
+import pytest
+
+from app.models import User
+from app.services.llm import (
+    DISCLAIMER,
+    LLMClient,
+    ResponseCache,
+    fix_height_weight_swap,
+    llm_client,
+    validate_profile,
+)
+
+
+def test_validate_profile_accepts_nulls():
+    parsed = validate_profile({"desired_wake_time": None, "height_cm": 178, "weight_kg": 74.5})
+    assert parsed["height_cm"] == 178
+    assert "parse_warnings" not in parsed
+
+
+def test_validate_profile_drops_invalid_fields():
+    parsed = validate_profile(
+        {
+            "height_cm": "178",
+            "weight_kg": 74,
+            "trainings": [{"day": "Понедельник", "time": "19:00"}],
+            "parse_warnings": ["possible_height_weight_swap"],
+        }
+    )
+    assert "height_cm" not in parsed
+    assert "trainings" not in parsed
+    assert parsed["weight_kg"] == 74
+    assert parsed["parse_warnings"] == [
+        "possible_height_weight_swap",
+        "invalid_trainings",
+        "invalid_height_cm",
+    ]
+
+
+def test_validate_profile_keeps_valid_trainings():
+    parsed = validate_profile(
+        {"trainings": [{"day": "Mon", "time": "19:00"}, {"day": "Понедельник", "time": "19:00"}, "вт"]}
+    )
+    assert parsed["trainings"] == [{"day": "Mon", "time": "19:00"}]
+    assert parsed["parse_warnings"] == ["invalid_trainings"]
+
+
+def test_validate_profile_rejects_non_object():
+    with pytest.raises(ValueError):
+        validate_profile(["not", "an", "object"])
+
+
+def test_llm_client_keeps_env_proxy(monkeypatch):
+    monkeypatch.setenv("HTTPS_PROXY", "http://proxy.local:3128")
+    http_client = LLMClient("sk-test")._client._client
+    proxies = [transport._pool._proxy_url.host for transport in http_client._mounts.values()]
+    assert proxies == [b"proxy.local"]
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(maxsize=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_response_cache_expires_entries():
+    cache = ResponseCache(ttl_seconds=-1)
+    cache.set("a", "1")
+    assert cache.get("a") is None
+
+
+@pytest.mark.parametrize(
+    ("height", "weight", "expected"),
+    [
+        (178, 74, (178, 74)),
+        (74, 178, (178, 74.0)),
+        (165, 172, (165, 172)),
+        (150, 152, (150, 152)),
+        (160, 190, (190, 160.0)),
+        (172, 165, (172, 165)),
+        (120, 60, (120, 60)),
+    ],
+)
+def test_fix_height_weight_swap(height, weight, expected):
+    parsed = fix_height_weight_swap({"height_cm": height, "weight_kg": weight})
+    assert (parsed["height_cm"], parsed["weight_kg"]) == expected
+
+
+async def test_generate_summaries_batch_limits_concurrency():
+    client = LLMClient(api_key=None)
+    in_flight = 0
+    peak = 0
+
+    async def fake_summary(user, summary_data):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return f"{user.telegram_id}:{summary_data['day']}"
+
+    client.generate_summary = fake_summary
+    items = [(User(telegram_id=i), {"day": i}) for i in range(10)]
+    results = await client.generate_summaries_batch(items, concurrency=3)
+    assert results == [f"{i}:{i}" for i in range(10)]
+    assert peak == 3
+
+
+async def test_generate_summaries_batch_keeps_results_when_one_fails():
+    client = LLMClient(api_key=None)
+
+    async def flaky_summary(user, summary_data):
+        if user.telegram_id == 1:
+            raise TimeoutError("rate limited")
+        return f"ok:{user.telegram_id}"
+
+    client.generate_summary = flaky_summary
+    items = [(User(telegram_id=i), {}) for i in range(3)]
+    assert await client.generate_summaries_batch(items) == ["ok:0", None, "ok:2"]
+
+
+async def test_parse_profile_reuses_cached_completion(fake_completions):
+    fake_completions.reply = '{"height_cm": 180, "weight_kg": 75, "trainings": [], "goals": []}'
+    first = await llm_client.parse_profile("рост 180, вес 75")
+    first["height_cm"] = 0
+    second = await llm_client.parse_profile("рост 180, вес 75")
+    assert len(fake_completions.calls) == 1
+    assert second["height_cm"] == 180
+
+
+async def test_ask_stream_yields_chunks_then_disclaimer_and_fills_cache(fake_completions):
+    fake_completions.chunks = ["Ложитесь ", "в 23:00."]
+    user = User(telegram_id=1, desired_wake_time=time(7, 0), sleep_goal_minutes=480)
+    parts = [part async for part in llm_client.ask_stream(user, "Когда ложиться?")]
+    assert parts == ["Ложитесь ", "в 23:00.", f"\n\n{DISCLAIMER}"]
+
+    cached = [part async for part in llm_client.ask_stream(user, "Когда ложиться?")]
+    assert cached == [f"Ложитесь в 23:00.\n\n{DISCLAIMER}"]
+    assert len(fake_completions.calls) == 1
+    assert fake_completions.calls[0]["stream"] is True
@@ -0,0 +1,10 @@
+from app.services.modules import DEFAULT_MODULES, modules_from_text
+
+
+def test_modules_from_text_detects_keywords():
+    modules = modules_from_text("Хочу наладить СОН, пить больше воды — вода важна, и спорт по вечерам")
+    assert modules == ["hydration", "sleep", "training"]
+
+
+def test_modules_from_text_falls_back_to_defaults():
+    assert modules_from_text("просто привет") == DEFAULT_MODULES
@@ -1,4 +1,4 @@
-from datetime import datetime, time
+from datetime import date, datetime, time
 
 from app.models import MealType, TrainingSession, TrainingStatus, User
 from app.services import nutrition
@@ -37,3 +37,26 @@ def test_adapt_plan_after_training_cancel():
     assert MealType.SNACK not in types
     assert MealType.POST_WORKOUT not in types
 
+
+def test_generate_daily_plan_training_slots_follow_training_time():
+    user = User(telegram_id=1, desired_wake_time=time(7, 0), sleep_goal_minutes=420)
+    training = TrainingSession(
+        id=1,
+        user_id=1,
+        planned_time=datetime.combine(date.today(), time(19, 0)),
+        status=TrainingStatus.SCHEDULED,
+    )
+    plan = nutrition.generate_daily_plan(user, user.desired_wake_time, None, None, [training])
+    slots = {slot.meal_type: slot for slot in plan}
+    assert slots[MealType.BREAKFAST].target_time == time(7, 45)
+    assert slots[MealType.DINNER].target_time == time(16, 30)
+    assert slots[MealType.SNACK].window_start == time(18, 0)
+    assert slots[MealType.POST_WORKOUT].window_end == time(20, 30)
+    assert [slot.target_time for slot in plan] == sorted(slot.target_time for slot in plan)
+
+
+def test_serialize_plan_roundtrip():
+    user = User(telegram_id=1, desired_wake_time=time(6, 5), sleep_goal_minutes=420)
+    plan = nutrition.generate_daily_plan(user, user.desired_wake_time, time(9, 0), time(18, 0), [])
+    restored = nutrition.deserialize_plan(nutrition.serialize_plan(plan))
+    assert restored == plan
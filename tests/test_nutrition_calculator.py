@@ -2,13 +2,16 @@ from __future__ import annotations
 
 import pytest
 
+from app.services import nutrition_calculator
 from app.services.nutrition_calculator import (
     calculate_bmr,
     calculate_bmi,
     calculate_target_calories,
     calculate_tdee,
     calculate_water_ml,
+    enrich_with_llm,
     generate_nutrition_plan,
+    generate_nutrition_plans_batch,
     get_activity_factor,
 )
 
@@ -236,3 +239,85 @@ def test_generate_nutrition_plan_with_schedule():
     assert pre_post["pre_workout"] is not None
     assert pre_post["post_workout"] is not None
 
+
+def test_generate_nutrition_plan_returns_independent_copies():
+    """Повторный вызов с тем же профилем не видит изменений предыдущего результата"""
+    profile = {
+        "sex": "f",
+        "age": 35,
+        "weight_kg": 65,
+        "height_cm": 165,
+        "desired_wake_time": "07:00",
+    }
+    
+    first = generate_nutrition_plan(profile)
+    first["numbers"]["macros"]["protein_g"] = 0
+    first["schedule"]["meals"].clear()
+    
+    second = generate_nutrition_plan(profile)
+    assert second["numbers"]["macros"]["protein_g"] > 0
+    assert len(second["schedule"]["meals"]) == 4
+    assert second["meta"]["input_profile"] is profile
+
+
+async def test_enrich_with_llm_reuses_cached_completion(fake_completions, monkeypatch):
+    """Одинаковый план не отправляется в LLM повторно"""
+    fake_completions.reply = '{"summary": "Короткая сводка"}'
+    monkeypatch.setattr(nutrition_calculator, "_enrich_cache", nutrition_calculator.ResponseCache())
+
+    profile = {"sex": "m", "age": 40, "weight_kg": 90, "height_cm": 185}
+    first = await enrich_with_llm(generate_nutrition_plan(profile))
+    second = await enrich_with_llm(generate_nutrition_plan(profile))
+
+    assert len(fake_completions.calls) == 1
+    assert first["human_text"] == second["human_text"] == "Короткая сводка"
+    assert first["llm_response"] is not second["llm_response"]
+
+
+async def test_enrich_with_llm_does_not_cache_non_json_reply(fake_completions, monkeypatch):
+    """Ответ не в JSON показывается как есть, но при следующем запросе LLM вызывается снова"""
+    fake_completions.reply = "Не JSON"
+    monkeypatch.setattr(nutrition_calculator, "_enrich_cache", nutrition_calculator.ResponseCache())
+
+    profile = {"sex": "f", "age": 33, "weight_kg": 58, "height_cm": 164}
+    first = await enrich_with_llm(generate_nutrition_plan(profile))
+    assert first["llm_response"] == {"raw": "Не JSON"}
+
+    fake_completions.reply = '{"summary": "Вторая попытка"}'
+    second = await enrich_with_llm(generate_nutrition_plan(profile))
+    assert len(fake_completions.calls) == 2
+    assert second["human_text"] == "Вторая попытка"
+
+
+async def test_enrich_with_llm_falls_back_on_api_error(fake_completions, monkeypatch):
+    """Ошибка OpenAI не ломает план — пользователь получает базовый текст"""
+    from openai import OpenAIError
+
+    fake_completions.error = OpenAIError("boom")
+    monkeypatch.setattr(nutrition_calculator, "_enrich_cache", nutrition_calculator.ResponseCache())
+
+    plan = await enrich_with_llm(generate_nutrition_plan({"weight_kg": 70, "height_cm": 175}))
+    numbers = plan["numbers"]
+    assert plan["human_text"].startswith(f"Ваш план: {numbers['calories']} ккал")
+    assert f"вода {numbers['water_ml']} мл." in plan["human_text"]
+    assert plan["llm_response"] is None
+
+
+def test_generate_nutrition_plans_batch_matches_single_plans():
+    """Пакетный расчёт совпадает с поштучным и не делит словари между планами"""
+    profiles = [
+        {"sex": "m", "age": 30, "weight_kg": 80, "height_cm": 180, "goal": "lose"},
+        {"sex": "f", "age": 25, "weight_kg": 60, "height_cm": 168, "desired_wake_time": "06:30"},
+        {"sex": "m", "age": 30, "weight_kg": 80, "height_cm": 180, "goal": "lose"},
+    ]
+    
+    plans = generate_nutrition_plans_batch(profiles)
+    
+    assert len(plans) == 3
+    assert len({plan["meta"]["timestamp"] for plan in plans}) == 1
+    for profile, plan in zip(profiles, plans):
+        single = generate_nutrition_plan(profile)
+        assert plan["numbers"] == single["numbers"]
+        assert plan["schedule"] == single["schedule"]
+        assert plan["meta"]["input_profile"] is profile
+    assert plans[0]["numbers"] is not plans[2]["numbers"]
@@ -0,0 +1,97 @@
+from datetime import time
+
+from app.services import onboarding_parser
+from app.services.onboarding_parser import _to_time, heuristic_parse, heuristic_parse_many
+
+
+def test_heuristic_parse_full_profile():
+    parsed = heuristic_parse(
+        "Встаю в 7:30, сплю 8 часов. Рост 180, вес 75 кг, мне 30, муж. "
+        "Работаю с 9 до 18, тренировки пн/вт/пт в 20:00. Хочу похудеть."
+    )
+    assert parsed.desired_wake_time == time(7, 30)
+    assert parsed.sleep_goal_minutes == 480
+    assert parsed.height_cm == 180
+    assert parsed.weight_kg == 75
+    assert parsed.age == 30
+    assert parsed.sex == "m"
+    assert parsed.work_start == time(9, 0)
+    assert parsed.work_end == time(18, 0)
+    assert parsed.workouts == [
+        {"day": "mon", "time": "20:00"},
+        {"day": "tue", "time": "20:00"},
+        {"day": "fri", "time": "20:00"},
+    ]
+    assert "weight_loss" in parsed.goals
+
+
+def test_heuristic_parse_evening_context_and_water():
+    parsed = heuristic_parse("подъём в 8 вечера, вода 2 литра в день, вт 19:00")
+    assert parsed.desired_wake_time == time(20, 0)
+    assert parsed.hydration_goal_ml == 2000
+    assert parsed.workouts == [{"day": "tue", "time": "19:00"}]
+
+
+def test_heuristic_parse_free_text_goal():
+    parsed = heuristic_parse("Моя цель — бегать марафоны. Остальное потом")
+    assert parsed.goals == ["Моя цель — бегать марафоны"]
+
+
+def test_heuristic_parse_keeps_pattern_priority():
+    # "с 9 до 18" приоритетнее более общего "2-3", даже если тот встречается раньше
+    parsed = heuristic_parse("Бегаю 2-3 раза в неделю, работаю с 9 до 18")
+    assert parsed.work_start == time(9, 0)
+    assert parsed.work_end == time(18, 0)
+
+
+def test_to_time_simple_formats():
+    assert _to_time("07:30") == time(7, 30)
+    assert _to_time(" 7:05 PM ") == time(19, 5)
+    assert _to_time("12:00 am") == time(0, 0)
+    assert _to_time("21:00 утра") == time(9, 0)
+    assert _to_time("24:00") == time(0, 0)
+
+
+def test_heuristic_parse_many_returns_independent_profiles():
+    text = "Встаю в 7:00, тренировки пн/пт в 19:00. Хочу похудеть."
+    first, second, other = heuristic_parse_many([text, text, "Рост 170, вес 60"])
+    assert first == second == heuristic_parse(text)
+    first.workouts.append({"day": "sun", "time": "10:00"})
+    assert second.workouts == heuristic_parse(text).workouts
+    assert other == heuristic_parse("Рост 170, вес 60")
+
+
+def test_heuristic_parse_height_fallback_after_sleep_pattern():
+    # Цель сна найдена шаблоном, а рост/вес — только по диапазонам чисел
+    parsed = heuristic_parse("Сплю 8 часов, рост и вес: 182 и 77")
+    assert parsed.sleep_goal_minutes == 480
+    assert parsed.height_cm == 182
+    assert parsed.weight_kg == 77
+
+
+async def test_parse_freeform_profile_skips_llm_for_complete_profile(fake_completions):
+    complete = (
+        "Встаю в 7:00, сплю 8 часов, рост 180, вес 75 кг, мне 30, муж. "
+        "Работаю с 9 до 18, тренировки пн/пт в 19:00. Хочу похудеть."
+    )
+    parsed = await onboarding_parser.parse_freeform_profile(complete)
+    assert fake_completions.calls == []
+    assert parsed.age == 30
+    assert parsed.work_start == time(9, 0)
+    assert parsed.work_end == time(18, 0)
+    assert parsed.workouts == [{"day": "mon", "time": "19:00"}, {"day": "fri", "time": "19:00"}]
+
+
+async def test_parse_freeform_profile_asks_llm_for_trainings(fake_completions):
+    fake_completions.reply = (
+        '{"trainings": [{"day": "Tue", "time": "19:00"}, {"day": "Thu", "time": "19:00"}],'
+        ' "goals": ["energy"], "work_start": "09:00", "work_end": "18:00"}'
+    )
+    parsed = await onboarding_parser.parse_freeform_profile(
+        "Подъём в 6:30, сплю 7 часов, рост 165, вес 60, мне 25 лет, женщина, "
+        "хочу больше энергии, тренировки вт и чт в 19:00"
+    )
+    assert len(fake_completions.calls) == 1
+    assert parsed.workouts == [{"day": "tue", "time": "19:00"}, {"day": "thu", "time": "19:00"}]
+    assert parsed.goals == ["energy"]
+    assert parsed.work_start == time(9, 0)
@@ -0,0 +1,14 @@
+from app.models import User
+from app.services import nutrition_calculator, personalization
+
+
+def test_estimate_calories_reuses_plan_cache():
+    nutrition_calculator._plan_core.cache_clear()
+    user = User(telegram_id=1, sex="f", age=28, weight_kg=61.5, height_cm=168, goals="Хочу похудеть")
+    first = personalization.estimate_calories(user)
+    first["target"] = 0
+    second = personalization.estimate_calories(user)
+    info = nutrition_calculator._plan_core.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+    assert second["target"] < second["maintenance"]
+    assert second["macro"].startswith("Б/Ж/У ")
@@ -1,6 +1,6 @@
 from datetime import time
 
-from app.models import User
+from app.models import SleepLog, User
 from app.services import sleep
 
 
@@ -23,3 +23,26 @@ def test_chronotherapy_plan():
     assert plan, "Plan should not be empty"
     assert plan[-1][1] == time(23, 0)
 
+
+def test_compute_sleep_debt_counts_only_shortfall():
+    logs = [
+        SleepLog(user_id=1, duration_minutes=360),
+        SleepLog(user_id=1, duration_minutes=480),
+        SleepLog(user_id=1, duration_minutes=None),
+        SleepLog(user_id=1, duration_minutes=400),
+    ]
+    assert sleep.compute_sleep_debt(logs, 420) == 80
+    assert sleep.compute_sleep_debt([], 420) == 0
+
+
+def test_chronotherapy_oscillates_when_step_overshoots():
+    plan = sleep.suggest_chronotherapy(time(0, 0), time(0, 40), step_minutes=30)
+    assert len(plan) == sleep.CHRONOTHERAPY_MAX_DAYS
+    assert plan[:3] == [(1, time(0, 30)), (2, time(1, 0)), (3, time(0, 30))]
+
+
+def test_record_sleep_log_crosses_midnight():
+    logs: list[SleepLog] = []
+    log = sleep.record_sleep_log(make_user(), time(23, 40), time(7, 10), logs)
+    assert log.duration_minutes == 450
+    assert logs == [log]
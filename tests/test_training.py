@@ -0,0 +1,22 @@
+from datetime import date, datetime
+
+from app.models import User
+from app.services.training import plan_week_sessions
+
+
+def test_plan_week_sessions_sorted_within_week():
+    user = User(telegram_id=1)
+    user.set_workout_days(
+        [
+            {"day": "mon", "time": "08:00"},
+            {"day": "Fri", "time": "19:30"},
+            {"day": "wed"},
+            {"day": "unknown", "time": "10:00"},
+        ]
+    )
+    # 2024-01-03 — среда
+    assert plan_week_sessions(user, date(2024, 1, 3)) == [
+        datetime(2024, 1, 3, 19, 0),
+        datetime(2024, 1, 5, 19, 30),
+        datetime(2024, 1, 8, 8, 0),
+    ]